@@ -0,0 +1,125 @@
+"""End-to-end benchmark of the exporter against a fleet of mock PDUs
+
+For every fleet size, a fresh process starts an exporter for that many mock
+PDUs and scrapes it repeatedly. Reported are the startup time (discovery of
+all PDUs), the percentiles of the scrape latency, the CPU time per scrape
+and the peak memory of the process, e.g.,
+
+    python -m benchmarks.e2e --fleet 1 10 100 500 --outlets 48 \\
+        --output results.jsonl
+    python -m benchmarks.e2e --fleet 1 10 100 500 --outlets 48 \\
+        --compare results.jsonl
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict
+import argparse
+import multiprocessing
+import resource
+import sys
+import time
+
+from prometheus_client import CollectorRegistry, generate_latest
+
+from prometheus_raritan_pdu_exporter.exporter import RaritanExporter
+from prometheus_raritan_pdu_exporter.jsonrpc import RaritanAuth
+
+from . import mockpdu, results
+
+# Measures compared to the baseline
+MEASURES = ('startup', 'p50', 'p90', 'p99', 'cpu', 'rss')
+
+
+def measure(
+        url: str, fleet: int, scrapes: int, exporter: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Startup time, scrape latency, CPU time and memory of an exporter for
+    `fleet` mock PDUs at `url`"""
+    config = [
+        RaritanAuth(
+            name=f'pdu{i:04}', url=url, user='admin', password='admin')
+        for i in range(fleet)]
+
+    start = time.perf_counter()
+    collector = RaritanExporter(config=config, **exporter)
+    startup = time.perf_counter() - start
+    registry = CollectorRegistry()
+    registry.register(collector)
+
+    latencies = []
+    cpu = time.process_time()
+    for _ in range(scrapes):
+        start = time.perf_counter()
+        generate_latest(registry)
+        latencies.append(time.perf_counter() - start)
+    cpu = (time.process_time() - cpu) / scrapes
+
+    sensors = sum(pdu.n_sensors for pdu in collector.pdus)
+    failed = len(collector.failed)
+    collector.close()
+
+    return {
+        'name': f'e2e/fleet={fleet}', 'fleet': fleet, 'sensors': sensors,
+        'failed': failed, 'scrapes': scrapes, 'startup': startup,
+        'p50': results.percentile(latencies, 50),
+        'p90': results.percentile(latencies, 90),
+        'p99': results.percentile(latencies, 99),
+        'cpu': cpu,
+        # kilobytes on Linux
+        'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='End-to-end benchmark against a fleet of mock PDUs')
+    parser.add_argument(
+        '--fleet', type=int, nargs='+', default=[1, 10, 50, 100],
+        help='numbers of PDUs to benchmark')
+    parser.add_argument(
+        '--scrapes', type=int, default=10,
+        help='scrapes per fleet size')
+    parser.add_argument(
+        '--processes', type=int, default=1,
+        help='processes serving the mock PDUs')
+    parser.add_argument('--batch-size', type=int, default=None)
+    parser.add_argument('--max-requests', type=int, default=None)
+    parser.add_argument(
+        '--output', default=None,
+        help='append the results to this file (JSON lines)')
+    parser.add_argument(
+        '--compare', default=None,
+        help='compare the results to those in this file')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.1,
+        help='relative increase of a measure that is a regression')
+    mockpdu.add_arguments(parser)
+    args = parser.parse_args()
+
+    exporter = dict(batch_size=args.batch_size, max_requests=args.max_requests)
+    records = []
+    context = multiprocessing.get_context('spawn')
+    with mockpdu.MockServer(
+            processes=args.processes, **mockpdu.options(args)) as url:
+        for fleet in args.fleet:
+            # a fresh process for every fleet size, so that the memory of
+            # one does not add up to the next
+            with ProcessPoolExecutor(1, mp_context=context) as executor:
+                record = executor.submit(
+                    measure, url, fleet, args.scrapes, exporter).result()
+            records.append(record)
+            print(
+                f'{fleet:>5} PDUs {record["sensors"]:>8} sensors '
+                f'startup {record["startup"]:8.3f}s '
+                f'p50 {record["p50"]:8.3f}s p90 {record["p90"]:8.3f}s '
+                f'p99 {record["p99"]:8.3f}s cpu {record["cpu"]:8.3f}s '
+                f'rss {record["rss"]:8.1f}MiB', file=sys.stderr)
+
+    if args.output is not None:
+        results.save(args.output, records)
+    if args.compare is not None:
+        baseline = results.load(args.compare)
+        sys.exit(0 if results.compare(
+            baseline, records, MEASURES, tolerance=args.tolerance) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""Micro-benchmarks of the code that runs for every sensor on every scrape
+
+The payloads are those of mock PDUs (modeled on the recorded cassette),
+discovered and read with the regular code of the exporter but without any
+HTTP requests. Every benchmark is timed `--repeat` times, reporting the
+fastest and the median run as well as the median time per sensor, e.g.,
+
+    python -m benchmarks.micro --pdus 10 --outlets 300 --output micro.jsonl
+    python -m benchmarks.micro --pdus 10 --outlets 300 --compare micro.jsonl
+"""
+from typing import Any, Callable, Dict, List, Tuple
+from unittest import mock
+import argparse
+import asyncio
+import gc
+import statistics
+import sys
+import time
+
+from prometheus_raritan_pdu_exporter.exporter import RaritanExporter
+from prometheus_raritan_pdu_exporter.interfaces import (
+    PDU, Metric, Readings, Sensor)
+from prometheus_raritan_pdu_exporter.jsonrpc import (
+    RaritanAuth, ReadingResponses, Request, Responses, dumps, loads)
+
+from . import mockpdu, results
+
+# Measures compared to the baseline
+MEASURES = ('min', 'median')
+
+
+def payloads(
+        pdu: mockpdu.MockPDU, n_pdus: int
+) -> Tuple[List[PDU], List[Readings], Dict[str, bytes]]:
+    """PDUs discovered from and read from the mock PDU, and the (largest)
+    responses of the mock PDU to the discovery and reading requests"""
+    bodies = {}
+
+    async def send(self, parse: Callable = Responses):
+        data = dumps(pdu.bulk(self.json))
+        methods = {request['json']['method'] for request in self.requests}
+        key = (
+            'readings' if 'getReading' in methods else
+            'details' if 'getSettings' in methods else 'other')
+        if len(data) > len(bodies.get(key, b'')):
+            bodies[key] = data
+        return parse(loads(data))
+
+    pdus = [
+        PDU(auth=RaritanAuth(
+            name=f'pdu{i:04}', url='http://127.0.0.1', user='admin',
+            password='admin'))
+        for i in range(n_pdus)]
+
+    async def discover() -> List[Readings]:
+        await asyncio.gather(*[pdu.setup() for pdu in pdus])
+        return await asyncio.gather(*[pdu.read_values() for pdu in pdus])
+
+    with mock.patch.object(Request, 'send', send):
+        readings = asyncio.run(discover())
+    return pdus, readings, bodies
+
+
+def benchmarks(
+        pdus: List[PDU], readings: List[Readings], bodies: Dict[str, bytes]
+) -> Tuple[Dict[str, Tuple[Callable[[], Any], int]], RaritanExporter]:
+    """Benchmarked functions by name, with the number of items (sensors or
+    responses) each processes, and the exporter they use"""
+    sensors = [sensor for pdu in pdus for sensor in pdu.sensors]
+    specs = [dict(sensor.spec, parent=sensor.parent) for sensor in sensors]
+    values = [
+        (sensor, value, timestamp) for r in readings
+        for sensor, value, timestamp in zip(
+            r.sensors, r.values, r.timestamps)]
+    details, reading = loads(bodies['details']), loads(bodies['readings'])
+    n_details = len(details['result']['responses'])
+    n_readings = len(reading['result']['responses'])
+
+    # without a poller, the exporter reads on every call to `read()`, which
+    # is pointed at the prepared readings
+    exporter = RaritanExporter(config=[])
+    exporter.pdus = pdus
+    exporter._read_values = lambda **kwargs: (readings, [])
+
+    def reading_responses():
+        ReadingResponses(
+            reading, values=[None] * n_readings,
+            timestamps=[None] * n_readings)
+
+    return {
+        'responses/details': (lambda: Responses(details), n_details),
+        'responses/readings': (lambda: Responses(reading), n_readings),
+        'reading_responses': (reading_responses, n_readings),
+        'sensor': (lambda: [Sensor(**spec) for spec in specs], len(specs)),
+        'metric': (lambda: [
+            Metric(sensor=sensor, value=value, timestamp=timestamp)
+            for sensor, value, timestamp in values], len(values)),
+        'read': (exporter.read, len(values)),
+        'collect': (
+            lambda: list(exporter._families(readings, [])), len(values)),
+    }, exporter
+
+
+def measure(
+        name: str, function: Callable[[], Any], n: int, repeat: int
+) -> Dict[str, Any]:
+    timings = []
+    for _ in range(repeat):
+        gc.collect()  # garbage of earlier runs is not collected in this one
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+
+    median = statistics.median(timings)
+    return {
+        'name': f'micro/{name}', 'items': n, 'repeat': repeat,
+        'min': min(timings), 'median': median,
+        'per_item': median / n if n else None}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Micro-benchmarks of parsing and building metrics')
+    parser.add_argument(
+        '--pdus', type=int, default=10, help='number of mock PDUs')
+    parser.add_argument(
+        '--repeat', type=int, default=20, help='runs per benchmark')
+    parser.add_argument(
+        'only', nargs='*', help='names of the benchmarks to run (all)')
+    parser.add_argument(
+        '--output', default=None,
+        help='append the results to this file (JSON lines)')
+    parser.add_argument(
+        '--compare', default=None,
+        help='compare the results to those in this file')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.1,
+        help='relative increase of a measure that is a regression')
+    mockpdu.add_arguments(parser)
+    args = parser.parse_args()
+
+    pdu = mockpdu.MockPDU(**dict(
+        mockpdu.options(args), latency=0, jitter=0, error_rate=0))
+    functions, exporter = benchmarks(*payloads(pdu, args.pdus))
+    records = []
+    try:
+        for name, (function, n) in functions.items():
+            if args.only and name not in args.only:
+                continue
+
+            record = measure(name, function, n, args.repeat)
+            records.append(record)
+            print(
+                f'{name:<20} {n:>8} items min {record["min"] * 1e3:9.3f}ms '
+                f'median {record["median"] * 1e3:9.3f}ms '
+                f'{record["per_item"] * 1e9:9.1f}ns/item', file=sys.stderr)
+    finally:
+        exporter.close()
+
+    if args.output is not None:
+        results.save(args.output, records)
+    if args.compare is not None:
+        baseline = results.load(args.compare)
+        sys.exit(0 if results.compare(
+            baseline, records, MEASURES, tolerance=args.tolerance) else 1)
+
+
+if __name__ == '__main__':
+    main()
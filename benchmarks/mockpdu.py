@@ -0,0 +1,326 @@
+"""Mock Raritan PDU, answering the JSON-RPC `performBulk` requests of the
+exporter at `/bulk` for a synthetic topology
+
+Every PDU of a fleet can use the same server, as the topology does not
+depend on the PDU. Start a server with, e.g.,
+
+    python -m benchmarks.mockpdu --port 8080 --outlets 48 --latency 0.05
+"""
+from dataclasses import dataclass, fields
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import multiprocessing
+import random
+import time
+
+from aiohttp import web
+
+from prometheus_raritan_pdu_exporter.jsonrpc import dumps, loads
+
+NUMERIC = 'sensors.NumericSensor:4.0.5'
+ACCUMULATING = 'sensors.AccumulatingNumericSensor:2.0.5'
+
+# Sensors of each connector: name, interface, (type, unit) of the reading
+# (see SENSORS_TYPES and SENSORS_UNITS) and range of the values
+INLET_SENSORS = [
+    ('voltage', NUMERIC, (1, 1), (220., 240.)),
+    ('current', NUMERIC, (2, 2), (0., 32.)),
+    ('activePower', NUMERIC, (4, 3), (0., 7000.)),
+    ('apparentPower', NUMERIC, (4, 4), (0., 7500.)),
+    ('powerFactor', NUMERIC, (5, 0), (0., 1.)),
+    ('activeEnergy', ACCUMULATING, (6, 5), (1e6, 1e7)),
+    ('unbalancedCurrent', NUMERIC, (3, 9), (0., 100.)),
+    ('lineFrequency', NUMERIC, (7, 8), (49.9, 50.1))]
+POLE_SENSORS = [
+    ('voltage', NUMERIC, (1, 1), (380., 415.)),
+    ('voltageLN', NUMERIC, (1, 1), (220., 240.)),
+    ('current', NUMERIC, (2, 2), (0., 32.)),
+    ('activePower', NUMERIC, (4, 3), (0., 7000.)),
+    ('apparentPower', NUMERIC, (4, 4), (0., 7500.)),
+    ('powerFactor', NUMERIC, (5, 0), (0., 1.)),
+    ('activeEnergy', ACCUMULATING, (6, 5), (1e6, 1e7))]
+OUTLET_SENSORS = [
+    ('voltage', NUMERIC, (1, 1), (220., 240.)),
+    ('current', NUMERIC, (2, 2), (0., 16.)),
+    ('activePower', NUMERIC, (4, 3), (0., 3500.)),
+    ('apparentPower', NUMERIC, (4, 4), (0., 3700.)),
+    ('powerFactor', NUMERIC, (5, 0), (0., 1.)),
+    ('activeEnergy', ACCUMULATING, (6, 5), (1e5, 1e6))]
+DEVICE_SENSORS = [
+    ('temperature', NUMERIC, (8, 7), (18., 30.)),
+    ('humidity', NUMERIC, (9, 9), (20., 60.))]
+
+
+@dataclass(frozen=True)
+class Topology:
+    """Connectors of a synthetic PDU"""
+    inlets: int = 1
+    poles: int = 3  # per inlet
+    outlets: int = 36
+    devices: int = 4  # peripheral devices, in the first device slots
+    slots: int = 64  # device slots
+
+    @property
+    def n_sensors(self) -> int:
+        return (
+            self.inlets * (
+                len(INLET_SENSORS) + self.poles * len(POLE_SENSORS))
+            + self.outlets * len(OUTLET_SENSORS)
+            + min(self.devices, self.slots))
+
+
+class MockPDU:
+    """Answers to the bulk requests of the exporter for `topology`
+
+    Each bulk request is delayed by `latency` seconds plus up to `jitter`
+    seconds and answered with a JSON-RPC error with probability
+    `error_rate`. Unknown resources and methods are answered with a JSON-RPC
+    error for the single request."""
+    def __init__(
+            self, topology: Topology = Topology(), latency: float = 0,
+            jitter: float = 0, error_rate: float = 0,
+            seed: Optional[int] = None) -> None:
+        self.topology = topology
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.resources: Dict[str, Dict[str, Any]] = {}
+        self.ranges: Dict[str, Tuple[float, float]] = {}
+        self.requests = 0
+        self._build()
+
+    def _sensor(
+            self, rid: str, interface: str, reading: Tuple[int, int],
+            values: Tuple[float, float]) -> Dict[str, str]:
+        metric, unit = reading
+        self.resources[rid] = {'getMetaData': {
+            'type': {'readingtype': 0, 'type': metric, 'unit': unit},
+            'decdigits': 3,
+            'range': {'lower': values[0], 'upper': values[1]}}}
+        self.ranges[rid] = values
+        return {'rid': rid, 'type': interface}
+
+    def _build(self) -> None:
+        topology = self.topology
+        inlets, outlets, slots = [], [], []
+        for i in range(topology.inlets):
+            rid = f'/tfwopaque/pdumodel.Inlet:3.0.0/inlet.{i}'
+            inlets.append({'rid': rid, 'type': 'pdumodel.Inlet:3.0.0'})
+            poles = []
+            for p in range(topology.poles):
+                poles.append({
+                    'label': f'L{p + 1}', 'line': p, 'nodeId': p + 1,
+                    **{name: self._sensor(
+                        f'/tfwopaque/{interface}/I{i}P{p}{name}',
+                        interface, reading, values)
+                       for name, interface, reading, values in POLE_SENSORS}})
+            self.resources[rid] = {
+                'getMetaData': {'label': f'I{i + 1}'},
+                'getSettings': {'name': ''},
+                'getSensors': {
+                    'peakCurrent': None,
+                    **{name: self._sensor(
+                        f'/tfwopaque/{interface}/I{i}{name}', interface,
+                        reading, values)
+                       for name, interface, reading, values in INLET_SENSORS}},
+                'getPoles': poles}
+
+        for i in range(topology.outlets):
+            rid = f'/tfwopaque/pdumodel.Outlet:3.0.0/outlet.{i}'
+            outlets.append({'rid': rid, 'type': 'pdumodel.Outlet:3.0.0'})
+            self.resources[rid] = {
+                'getMetaData': {'label': str(i + 1)},
+                'getSettings': {'name': f'outlet {i + 1}'},
+                'getSensors': {
+                    name: self._sensor(
+                        f'/tfwopaque/{interface}/O{i}{name}', interface,
+                        reading, values)
+                    for name, interface, reading, values in OUTLET_SENSORS}}
+
+        for i in range(topology.slots):
+            rid = f'/tfwopaque/peripheral.DeviceSlot:4.0.1/pDevSlot.{i}'
+            slots.append({'rid': rid, 'type': 'peripheral.DeviceSlot:4.0.1'})
+            device = None
+            if i < topology.devices:
+                _, interface, reading, values = DEVICE_SENSORS[
+                    i % len(DEVICE_SENSORS)]
+                device = {'type': 'peripheral.Device:6.0.0', 'value': {
+                    'deviceID': {'serial': f'MOCK{i:06}', 'type': {
+                        'readingtype': 0, 'type': reading[0],
+                        'unit': reading[1]}},
+                    'device': self._sensor(
+                        f'/tfwopaque/{interface}/EXT{i:02}N', interface,
+                        reading, values)}}
+            self.resources[rid] = {
+                'getSettings': {'name': f'slot {i + 1}'},
+                'getDevice': device}
+
+        self.resources['/model/pdu/0'] = {
+            'getInlets': inlets, 'getOutlets': outlets}
+        self.resources['/model/peripheraldevicemanager'] = {
+            'getDeviceSlots': slots}
+
+    def answer(self, rid: str, method: str, timestamp: int) -> Dict[str, Any]:
+        """Result (or error) of a single request of a bulk request"""
+        if method == 'getReading' and rid in self.ranges:
+            return {'result': {'_ret_': {
+                'timestamp': timestamp, 'available': True, 'valid': True,
+                'value': self.random.uniform(*self.ranges[rid])}}}
+
+        methods = self.resources.get(rid, {})
+        if method not in methods:
+            return {'error': {
+                'code': -32601, 'message': f'Method not found: {method}'}}
+        return {'result': {'_ret_': methods[method]}}
+
+    def bulk(self, json: Dict[str, Any]) -> Dict[str, Any]:
+        """Response to a JSON-RPC request"""
+        self.requests += 1
+        if json.get('method') != 'performBulk':
+            return {'jsonrpc': '2.0', 'id': json.get('id'), 'error': {
+                'code': -32601, 'message': 'Method not found'}}
+        if self.random.random() < self.error_rate:
+            return {'jsonrpc': '2.0', 'id': json.get('id'), 'error': {
+                'code': -32000, 'message': 'Injected error'}}
+
+        timestamp = int(time.time())
+        responses: List[Dict[str, Any]] = []
+        for request in json['params']['requests']:
+            answer = self.answer(
+                request['rid'], request['json']['method'], timestamp)
+            responses.append({'json': {
+                'jsonrpc': '2.0', **answer, 'id': request['json']['id']},
+                'statcode': 200})
+        return {
+            'jsonrpc': '2.0', 'result': {'responses': responses},
+            'id': json.get('id')}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        return web.Response(
+            body=dumps(self.bulk(loads(await request.read()))),
+            content_type='application/json-rpc')
+
+    def application(self) -> web.Application:
+        app = web.Application(client_max_size=2 ** 26)
+        app.router.add_post('/bulk', self.handle)
+        return app
+
+
+def serve(
+        conn: Connection, host: str = '127.0.0.1', port: int = 0,
+        reuse_port: bool = False, **kwargs: Any) -> None:
+    """Serve a mock PDU, the port is sent to `conn` once the server is
+    listening and the server stops when anything is received from `conn`"""
+    async def run() -> None:
+        runner = web.AppRunner(MockPDU(**kwargs).application())
+        await runner.setup()
+        site = web.TCPSite(runner, host, port, reuse_port=reuse_port or None)
+        await site.start()
+        conn.send(runner.addresses[0][1])
+        await asyncio.get_running_loop().run_in_executor(None, conn.recv)
+        await runner.cleanup()
+
+    asyncio.run(run())
+
+
+class MockServer:
+    """Mock PDUs served from `processes` background processes sharing the
+    same port, so that the mock does not slow down large benchmarks
+
+        with MockServer(topology=Topology(outlets=48)) as url:
+            ...
+    """
+    context = multiprocessing.get_context('spawn')
+
+    def __init__(
+            self, processes: int = 1, host: str = '127.0.0.1',
+            **kwargs: Any) -> None:
+        self.processes = processes
+        self.host = host
+        self.kwargs = kwargs
+        self.port = None
+        self._workers = []
+
+    @property
+    def url(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def start(self) -> str:
+        for _ in range(self.processes):
+            conn, child_conn = self.context.Pipe()
+            process = self.context.Process(
+                target=serve, args=(child_conn, self.host, self.port or 0),
+                kwargs=dict(reuse_port=self.processes > 1, **self.kwargs),
+                daemon=True)
+            process.start()
+            while not conn.poll(0.1):
+                if not process.is_alive():
+                    raise RuntimeError('Mock PDU server failed to start')
+            self.port = conn.recv()
+            self._workers.append((process, conn))
+        return self.url
+
+    def stop(self) -> None:
+        workers, self._workers = self._workers, []
+        for process, conn in workers:
+            conn.send(None)
+        for process, conn in workers:
+            process.join()
+            conn.close()
+
+    def __enter__(self) -> str:
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Options for the topology and the injected faults of mock PDUs"""
+    for field in fields(Topology):
+        parser.add_argument(
+            f'--{field.name}', type=int, default=field.default)
+    parser.add_argument(
+        '--latency', type=float, default=0,
+        help='seconds every bulk request is delayed')
+    parser.add_argument(
+        '--jitter', type=float, default=0,
+        help='maximum seconds bulk requests are delayed additionally')
+    parser.add_argument(
+        '--error-rate', type=float, default=0,
+        help='fraction of bulk requests answered with an error')
+    parser.add_argument('--seed', type=int, default=None)
+
+
+def options(args: argparse.Namespace) -> Dict[str, Any]:
+    """Arguments of `MockPDU` from the parsed options"""
+    return dict(
+        topology=Topology(**{
+            field.name: getattr(args, field.name)
+            for field in fields(Topology)}),
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        seed=args.seed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Mock Raritan PDU with a synthetic topology')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    pdu = MockPDU(**options(args))
+    print(f'Serving {pdu.topology.n_sensors} sensors')
+    web.run_app(pdu.application(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
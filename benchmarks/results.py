@@ -0,0 +1,90 @@
+"""Benchmark results, stored as JSON lines so that the results of two
+versions (e.g., the last release and a release candidate) can be compared
+
+Every record has a unique `name` within a run and any number of measures,
+lower values are better for all of them."""
+from typing import Any, Dict, Iterable, List, Optional
+import json
+import math
+import platform
+import subprocess
+import time
+
+
+def environment() -> Dict[str, Any]:
+    """Details of the run, stored with every record"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    try:
+        import orjson  # noqa: F401
+        decoder = 'orjson'
+    except ImportError:
+        decoder = 'json'
+
+    return {
+        'time': int(time.time()), 'commit': commit,
+        'python': platform.python_version(), 'machine': platform.machine(),
+        'decoder': decoder}
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile `p` (in [0, 100]) of `values`"""
+    ordered = sorted(values)
+    rank = math.ceil(p / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def save(path: Optional[str], records: Iterable[Dict[str, Any]]) -> None:
+    """Append the records to `path` (standard output without a path)"""
+    env = environment()
+    lines = [json.dumps({**record, 'env': env}) for record in records]
+    if path is None:
+        print('\n'.join(lines))
+        return
+
+    with open(path, 'a') as file:
+        file.writelines(f'{line}\n' for line in lines)
+
+
+def load(path: str) -> Dict[str, Dict[str, Any]]:
+    """Latest record of every name in `path`"""
+    records = {}
+    with open(path) as file:
+        for line in file:
+            if line.strip():
+                record = json.loads(line)
+                records[record['name']] = record
+    return records
+
+
+def compare(
+        baseline: Dict[str, Dict[str, Any]],
+        records: Iterable[Dict[str, Any]], measures: Iterable[str],
+        tolerance: float = 0.1) -> bool:
+    """Print the relative change of the measures of the records compared to
+    the baseline, returns whether none of them got worse by more than
+    `tolerance`"""
+    passed = True
+    for record in records:
+        base = baseline.get(record['name'])
+        if base is None:
+            print(f'{record["name"]}: not in baseline')
+            continue
+
+        for measure in measures:
+            if not base.get(measure) or measure not in record:
+                continue
+
+            change = record[measure] / base[measure] - 1
+            regressed = change > tolerance
+            passed = passed and not regressed
+            print(
+                f'{record["name"]} {measure}: {base[measure]:.6g} -> '
+                f'{record[measure]:.6g} ({change:+.1%})'
+                f'{" REGRESSION" if regressed else ""}')
+    return passed
@@ -35,3 +35,4 @@ def pytest_sessionstart(session):
     auth = config()
     exporter = RaritanExporter(config=auth)
     _ = exporter.read()
+    exporter.close()
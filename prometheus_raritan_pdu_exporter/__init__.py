@@ -8,6 +8,12 @@ EXPORTER_PREFIX = 'raritanpdu'
 # Default port used by the Raritan PDU Exporter
 DEFAULT_PORT = 9950
 
+# Default number of metric requests that are served concurrently
+DEFAULT_WORKERS = 4
+
+# Format of all log messages
+LOG_FORMAT = '[%(asctime)s] %(levelname)s: %(message)s'
+
 # All sensor interfaces that are to be recorded as prometheus gauges
 SENSORS_GAUGES = [
     'sensors.NumericSensor',
@@ -79,5 +85,6 @@ SENSORS_DESCRIPTION = {
         'Measured absolute humidity'}
 
 __all__ = [
-    logger, EXPORTER_PREFIX, DEFAULT_PORT, SENSORS_GAUGES, SENSORS_COUNTERS,
-    SENSORS_TYPES, SENSORS_UNITS, SENSORS_DESCRIPTION]
+    logger, EXPORTER_PREFIX, DEFAULT_PORT, DEFAULT_WORKERS, LOG_FORMAT,
+    SENSORS_GAUGES, SENSORS_COUNTERS, SENSORS_TYPES, SENSORS_UNITS,
+    SENSORS_DESCRIPTION]
@@ -0,0 +1,66 @@
+from typing import Any, Dict, List
+import json
+import os
+import tempfile
+
+from . import logger
+from .interfaces import PDU
+
+
+class TopologyCache:
+    """JSON file containing the discovered topology of every PDU, keyed by
+    PDU name, so that PDUs can be read immediately on start-up"""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.topologies = self._read()
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path) as json_file:
+                return json.load(json_file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as exc:
+            logger.warning(f'Ignoring topology cache {self.path}: {exc}')
+            return {}
+
+    def load(self, pdu: PDU) -> bool:
+        """Restore the cached topology of a PDU, returns whether the PDU was
+        found in the cache"""
+        topology = self.topologies.get(pdu.name)
+        if topology is None:
+            return False
+
+        try:
+            pdu.restore(topology)
+        except Exception as exc:
+            logger.warning(
+                f'({pdu.name}) Ignoring cached topology: {exc!r}')
+            return False
+
+        logger.info(f'({pdu.name}) Restored topology from cache')
+        return True
+
+    def update(self, pdus: List[PDU]) -> Dict[str, Dict[str, Any]]:
+        """Update the cached topologies of the given PDUs"""
+        self.topologies = {
+            **self.topologies,
+            **{pdu.name: pdu.topology() for pdu in pdus}}
+        return self.topologies
+
+    def save(self, topologies: Dict[str, Dict[str, Any]]) -> None:
+        """Atomically replace the cache file"""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        except OSError as exc:
+            logger.warning(f'Failed to write topology cache: {exc}')
+            return
+
+        try:
+            with os.fdopen(fd, 'w') as json_file:
+                json.dump(topologies, json_file)
+            os.replace(tmp_path, self.path)
+        except OSError as exc:
+            logger.warning(f'Failed to write topology cache: {exc}')
+            os.remove(tmp_path)
@@ -0,0 +1,71 @@
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional, Tuple
+import threading
+import time
+
+
+class FlightTimeout(Exception):
+    """A caller waited longer for the call in flight than it may take"""
+
+
+@dataclass
+class Flight:
+    """Call in flight (or completed) whose result is shared"""
+    id: str
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    exception: Optional[BaseException] = None
+    finished: Optional[float] = None
+
+
+class SingleFlight:
+    """Runs a single call at a time, sharing its result with every caller
+    that arrives while it is in flight (or up to `ttl` seconds after it
+    completed)
+
+    Concurrent scrapes thereby attach to the read of the PDUs already in
+    flight instead of reading them once more. Failed calls are not shared
+    after they completed; the next caller starts a new one."""
+    def __init__(self, ttl: float = 0) -> None:
+        self.ttl = ttl
+        self._flight: Optional[Flight] = None
+        self._lock = threading.Lock()
+
+    def _join(self, id: str) -> Tuple[Flight, bool]:
+        """The flight to share (or a new one) and whether it is new"""
+        with self._lock:
+            flight = self._flight
+            if flight is not None and (
+                    flight.finished is None
+                    or time.monotonic() - flight.finished <= self.ttl):
+                return flight, False
+
+            self._flight = Flight(id=id)
+            return self._flight, True
+
+    def run(
+            self, function: Callable[[], Any], id: str = '-',
+            timeout: Optional[float] = None) -> Tuple[Any, str]:
+        """Result of `function` (or of the call in flight) and the id of the
+        call it came from. Waiting for a call in flight raises a
+        FlightTimeout after `timeout` seconds."""
+        flight, new = self._join(id)
+        if new:
+            try:
+                flight.result = function()
+            except BaseException as exc:
+                flight.exception = exc
+                with self._lock:
+                    self._flight = None
+                raise
+            finally:
+                flight.finished = time.monotonic()
+                flight.done.set()
+        elif not flight.done.wait(timeout):
+            raise FlightTimeout(
+                f'Shared read #{flight.id} still in flight after '
+                f'{timeout:.2f}s')
+
+        if flight.exception is not None:
+            raise flight.exception
+        return flight.result, flight.id
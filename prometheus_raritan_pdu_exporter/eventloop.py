@@ -0,0 +1,53 @@
+from concurrent.futures import Future
+from typing import Any, Awaitable, Optional
+import asyncio
+import threading
+
+
+class EventLoopThread:
+    """Asyncio event loop running in a dedicated background thread
+
+    Coroutines are submitted from other threads (e.g., the HTTP server
+    handling a scrape) and run on the same loop for the lifetime of the
+    exporter, so that async resources such as HTTP sessions can be kept alive
+    between scrapes."""
+    def __init__(self, name: str = 'raritan-eventloop') -> None:
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def _run_forever(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread.is_alive()
+
+    def submit(self, coro: Awaitable) -> Future:
+        """Schedule a coroutine on the loop from another thread"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop and wait for its result"""
+        return self.submit(coro).result(timeout)
+
+    async def _shutdown(self) -> None:
+        tasks = [
+            task for task in asyncio.all_tasks(self.loop)
+            if task is not asyncio.current_task(self.loop)]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.loop.shutdown_asyncgens()
+
+    def stop(self) -> None:
+        """Cancel all pending tasks, then stop and close the loop"""
+        if not self.is_running:
+            return
+
+        self.run(self._shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
@@ -1,15 +1,27 @@
-from typing import List
+from contextvars import ContextVar
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 import asyncio
 import random
 import string
+import threading
 import time
 
 from prometheus_client import Summary
-from prometheus_client.core import GaugeMetricFamily, CounterMetricFamily
+from prometheus_client.core import (
+    GaugeMetricFamily, CounterMetricFamily, Metric as PromMetric)
 
-from . import logger
-from .interfaces import PDU, MetricFamily
-from .jsonrpc import RaritanAuth
+from . import logger, EXPORTER_PREFIX
+from .cache import TopologyCache
+from .coalescing import FlightTimeout, SingleFlight
+from .eventloop import EventLoopThread
+from .exposition import Exposition
+from .instrumentation import INSTRUMENTATION
+from .interfaces import (
+    PDU, BatchSize, CircuitBreaker, Metric, MetricFamily, Readings, Schedule)
+from .jsonrpc import RaritanAuth, RequestLimit
+from .profiling import PROFILER
+from .tracing import TRACER, Span
 
 
 # Measure collection time
@@ -18,32 +30,313 @@ REQUEST_TIME = Summary(
     'Time spent to collect metrics from the Raritan PDU')
 
 
+# Monotonic deadline of the scrape handled in the current context, set by
+# the HTTP handler from the scrape timeout sent by Prometheus
+SCRAPE_DEADLINE: ContextVar[Optional[float]] = ContextVar(
+    'scrape_deadline', default=None)
+
+# Whether the HTTP handler serves the readings of the current context from
+# the pre-rendered exposition, in which case they are not collected again
+PRERENDERED: ContextVar[bool] = ContextVar('prerendered', default=False)
+
+
+def trace_missed(span: Optional[Span], missed: List[str]) -> None:
+    """Tag the span of a collection with the PDUs that missed its deadline"""
+    if span is not None and missed:
+        span.tag(missed=','.join(missed))
+
+
+def new_collect_id() -> str:
+    """Random identifier used to trace a collection in the logs"""
+    return ''.join(
+        random.SystemRandom().choice(
+            string.ascii_letters + string.digits) for _ in range(6))
+
+
 class RaritanExporter:
-    def __init__(self, config: List[RaritanAuth]) -> None:
-        self.pdus = [PDU(auth=auth) for auth in config]
-        asyncio.run(self._setup())
+    # seconds before retrying the discovery of a PDU that failed it, doubled
+    # after every failed attempt up to the rediscovery interval
+    retry_delay = 30
+
+    def __init__(
+            self, config: List[RaritanAuth],
+            poll_interval: Optional[float] = None,
+            timeout: Optional[float] = None,
+            batch_size: Optional[int] = None,
+            batch_latency: Optional[float] = None,
+            discovery_interval: Optional[float] = None,
+            cache: Optional[str] = None,
+            intervals: Optional[Dict[str, float]] = None,
+            failure_threshold: Optional[int] = None,
+            max_requests: Optional[int] = None,
+            max_requests_per_pdu: Optional[int] = None,
+            coalesce_ttl: Optional[float] = None) -> None:
+        self.pdus = [
+            PDU(auth=auth, batch=BatchSize(
+                maximum=batch_size, latency=batch_latency),
+                schedule=Schedule(intervals=dict(intervals or {})),
+                breaker=CircuitBreaker(threshold=failure_threshold))
+            for auth in config]
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.discovery_interval = discovery_interval
+        self.cache = TopologyCache(cache) if cache else None
+        self.failed = []
+        self._tasks = []
+        self._snapshot = ([], [])
+        self.exposition = None
+        self._poller = None
+        self._stop = threading.Event()
+
+        # Concurrent scrapes (e.g., of redundant Prometheus servers) share
+        # a single read of the PDUs
+        self.flight = SingleFlight(ttl=coalesce_ttl or 0)
+
+        # All PDU requests run on a single long-lived event loop, so that
+        # the PDU sessions and their connections persist between scrapes
+        self.loop = EventLoopThread()
+        self.limit = RequestLimit(max_requests)
+        for pdu in self.pdus:
+            pdu.open(max_requests=max_requests_per_pdu, shared=self.limit)
+        self.loop.run(self._setup())
+
+        if self.poll_interval:
+            self.start()
 
     async def _setup(self):
-        await asyncio.gather(*[pdu.setup() for pdu in self.pdus])
+        if INSTRUMENTATION.enabled:
+            self._tasks.append(asyncio.ensure_future(
+                INSTRUMENTATION.monitor_event_loop()))
+
+        # PDUs with a cached topology are read right away and verified
+        # in the background, all others are discovered first
+        cached = [
+            self.cache is not None and self.cache.load(pdu)
+            for pdu in self.pdus]
+        await asyncio.gather(*[
+            pdu.setup() for pdu, hit in zip(self.pdus, cached) if not hit])
+        if any(cached):
+            self._tasks.append(asyncio.ensure_future(self._verify([
+                pdu for pdu, hit in zip(self.pdus, cached) if hit])))
+        await self._save_cache()
 
         pdus = []
         for pdu in self.pdus:
-            if len(pdu.connectors) + len(pdu.sensors) + len(pdu.poles) == 0:
+            if not pdu.is_discovered:
                 logger.warning(
                     f'Removed {pdu.name} from collection (meta-data retrieval '
                     f'failed)')
+                self.failed.append(pdu)
             else:
                 pdus.append(pdu)
 
         self.pdus = pdus
+        if pdus:
+            unmatched = set.intersection(*[
+                pdu.schedule.unmatched(pdu.sensors) for pdu in pdus])
+            for name in sorted(unmatched):
+                logger.warning(
+                    f'No metric family or sensor type \'{name}\' of a sensor '
+                    f'interval found on any PDU')
+
+        if self.discovery_interval:
+            self._tasks.append(asyncio.ensure_future(self._rediscover()))
+            self._tasks.extend(
+                asyncio.ensure_future(self._retry(pdu)) for pdu in self.failed)
+        else:
+            await asyncio.gather(*[pdu.close() for pdu in self.failed])
+
+    async def _save_cache(self, pdus: Optional[List[PDU]] = None) -> None:
+        """Write the topology of the (given) discovered PDUs to the cache"""
+        if self.cache is None:
+            return
+
+        pdus = self.pdus if pdus is None else pdus
+        pdus = [pdu for pdu in pdus if pdu.is_discovered]
+        topologies = self.cache.update(pdus)
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.cache.save, topologies)
+
+    async def _verify(self, pdus: List[PDU]) -> None:
+        """Rediscover PDUs restored from cache, replacing their topology
+        (and the cache) if it changed"""
+        changed = await asyncio.gather(*[pdu.rediscover() for pdu in pdus])
+        if any(changed):
+            await self._save_cache(
+                [pdu for pdu, change in zip(pdus, changed) if change])
+
+    async def _rediscover(self) -> None:
+        """Periodically rediscover the topology of all PDUs, so that added
+        or removed connectors and sensors are picked up without a restart"""
+        while True:
+            await asyncio.sleep(self.discovery_interval)
+            try:
+                await self._verify(self.pdus)
+            except Exception as exc:
+                logger.error(f'Rediscovery failed: {exc}')
+
+    async def _retry(self, pdu: PDU) -> None:
+        """Retry the discovery of a PDU with exponential backoff until it
+        succeeds, then add the PDU to the collection"""
+        delay = min(self.retry_delay, self.discovery_interval)
+        while True:
+            logger.info(f'({pdu.name}) Retrying discovery in {delay:.0f}s')
+            await asyncio.sleep(delay)
+            try:
+                await pdu.setup()
+            except Exception as exc:
+                logger.warning(f'({pdu.name}) Discovery failed: {exc}')
+
+            if pdu.is_discovered:
+                break
+
+            delay = min(
+                delay * 2, max(self.discovery_interval, self.retry_delay))
+
+        self.failed = [p for p in self.failed if p is not pdu]
+        self.pdus = [*self.pdus, pdu]
+        logger.warning(f'Added {pdu.name} to collection')
+        await self._save_cache([pdu])
+
+    @property
+    def snapshot(self) -> List[Readings]:
+        """Readings of the latest background poll"""
+        return self._snapshot[0]
+
+    def start(self) -> None:
+        """Poll the PDUs in a background thread every `poll_interval`
+        seconds. Collections then serve the latest snapshot instead of
+        reading from the PDUs."""
+        if self._poller is not None:
+            return
+
+        self.poll()  # make sure the first scrape has data to serve
+        self._stop.clear()
+        self._poller = threading.Thread(
+            target=self._poll, name='raritan-poller', daemon=True)
+        self._poller.start()
 
-    async def _read(self, collect_id: str = '-'):
-        return await asyncio.gather(
-            *[pdu.read(collect_id=collect_id) for pdu in self.pdus])
+    def close(self) -> None:
+        """Stop background polling, close all PDU sessions and stop the
+        event loop"""
+        self._stop.set()
+        if self._poller is not None:
+            self._poller.join()
+            self._poller = None
+            self.exposition = None
 
-    def read(self, collect_id: str = '-') -> List[MetricFamily]:
-        pdus = asyncio.run(self._read())
-        metrics = [metric for metrics in pdus for metric in metrics]
+        if self.loop.is_running:
+            self.loop.run(self._close())
+            self.loop.stop()
+
+    async def _close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await asyncio.gather(
+            *[pdu.close() for pdu in [*self.pdus, *self.failed]])
+
+    def _poll(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception as exc:
+                logger.error(f'Background poll failed: {exc}')
+
+    def poll(self) -> None:
+        """Refresh the snapshot of PDU readings"""
+        poll_id = new_collect_id()
+        start = time.time()
+        with PROFILER.collection(self.loop, poll_id), TRACER.trace(
+                'poll', collect_id=poll_id) as span:
+            self._snapshot = self._read_values(
+                collect_id=poll_id, timeout=self.timeout or self.poll_interval)
+            self.exposition = Exposition(
+                self._families(*self._snapshot, collect_id=poll_id))
+            trace_missed(span, self._snapshot[1])
+        logger.debug(
+            f'(#{poll_id}) refreshed snapshot in {time.time() - start:.2f}s')
+
+    async def _read(
+            self, collect_id: str = '-', timeout: Optional[float] = None,
+            pdus: Optional[List[PDU]] = None
+    ) -> Tuple[List[Readings], List[str]]:
+        """Read all (or the given) PDUs within `timeout` seconds. Readings
+        of PDUs that did not respond in time are cancelled and their names
+        returned."""
+        # PDUs may be added during the read
+        pdus = self.pdus if pdus is None else pdus
+        tasks = [
+            asyncio.ensure_future(pdu.read_values(collect_id=collect_id))
+            for pdu in pdus]
+        if not tasks:
+            return [], []
+
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+        missed = []
+        for pdu, task in zip(pdus, tasks):
+            if task in pending:
+                missed.append(pdu.name)
+                pdu.record(failed=True)
+
+        if missed:
+            logger.warning(
+                f"(#{collect_id}) {', '.join(missed)} missed the "
+                f"{timeout:.2f}s deadline")
+
+        readings = [task.result() for task in tasks if task not in pending]
+        return readings, missed
+
+    def read(
+            self, collect_id: str = '-', timeout: Optional[float] = None
+    ) -> List[MetricFamily]:
+        """Read all PDUs, returning whatever readings arrived within
+        `timeout` seconds"""
+        return self._read_families(collect_id=collect_id, timeout=timeout)[0]
+
+    def _read_values(
+            self, collect_id: str = '-', timeout: Optional[float] = None,
+            pdus: Optional[List[PDU]] = None
+    ) -> Tuple[List[Readings], List[str]]:
+        return self.loop.run(
+            self._read(collect_id=collect_id, timeout=timeout, pdus=pdus))
+
+    def _read_shared(
+            self, collect_id: str = '-', timeout: Optional[float] = None
+    ) -> Tuple[List[Readings], List[str]]:
+        """Read all PDUs, or share the readings of the read in flight (or of
+        one that completed less than `coalesce_ttl` seconds ago)"""
+        try:
+            (readings, missed), read_id = self.flight.run(
+                partial(
+                    self._read_values, collect_id=collect_id,
+                    timeout=timeout),
+                id=collect_id, timeout=timeout)
+        except FlightTimeout as exc:
+            # the shared read took longer than this collection may take
+            logger.warning(f'(#{collect_id}) {exc}')
+            return [], [pdu.name for pdu in self.pdus]
+
+        if read_id != collect_id:
+            logger.debug(f'(#{collect_id}) shared readings of #{read_id}')
+            TRACER.tag(shared=read_id)
+        return readings, missed
+
+    def _read_families(
+            self, collect_id: str = '-', timeout: Optional[float] = None
+    ) -> Tuple[List[MetricFamily], List[str]]:
+        pdus, missed = self._read_values(
+            collect_id=collect_id, timeout=timeout)
+        metrics = [
+            Metric(sensor=sensor, value=value, timestamp=timestamp)
+            for readings in pdus
+            for sensor, value, timestamp in zip(
+                readings.sensors, readings.values, readings.timestamps)
+            if timestamp is not None]
 
         # group metrics by family
         metric_family = dict()
@@ -53,48 +346,122 @@ class RaritanExporter:
             else:
                 metric_family[metric.name] = MetricFamily(metric)
 
-        return list(metric_family.values())
+        return list(metric_family.values()), missed
+
+    def deadline(self) -> Optional[float]:
+        """Seconds left to read the PDUs during the current scrape"""
+        deadline = SCRAPE_DEADLINE.get()
+        if deadline is None:
+            return self.timeout
+        return max(deadline - time.monotonic(), 0)
 
     @REQUEST_TIME.time()
     def collect(self):
         """Collect sensor readings, called every time the http server
-        containing the Raritan PDU metrics is requested"""
-        collect_id = ''.join(
-            random.SystemRandom().choice(
-                string.ascii_letters + string.digits) for _ in range(6))
+        containing the Raritan PDU metrics is requested. When polling in
+        the background, the latest snapshot is served instead."""
+        if PRERENDERED.get():
+            return
+
+        collect_id = new_collect_id()
         logger.debug(f'(#{collect_id}) received collect request')
+        if self._poller is not None:
+            pdus, missed = self._snapshot
+            yield from self._families(pdus, missed, collect_id=collect_id)
+            return
+
+        with PROFILER.collection(self.loop, collect_id), TRACER.trace(
+                'collect', collect_id=collect_id) as span:
+            pdus, missed = self._read_shared(
+                collect_id=collect_id, timeout=self.deadline())
+            trace_missed(span, missed)
+            yield from self._families(pdus, missed, collect_id=collect_id)
+
+    def probe(self, name: str) -> List[PromMetric]:
+        """Read a single PDU, returning its metric families and whether it
+        could be read (`raritanpdu_up`). Raises a KeyError for PDUs that are
+        not in the configuration."""
+        pdu = {pdu.name: pdu for pdu in [*self.failed, *self.pdus]}[name]
+        collect_id = new_collect_id()
+        logger.debug(f'({pdu.name}#{collect_id}) received probe request')
+
+        with TRACER.trace('probe', collect_id=collect_id, pdu=pdu.name):
+            # PDUs that failed discovery are not read, but reported as down
+            readings, missed = [], []
+            if pdu.is_discovered:
+                readings, missed = self._read_values(
+                    collect_id=collect_id, timeout=self.deadline(),
+                    pdus=[pdu])
+
+            return list(self._families(
+                readings, missed, collect_id=collect_id, pdus=[pdu]))
+
+    def _families(
+            self, readings: List[Readings], missed: List[str],
+            collect_id: str = '-', pdus: Optional[List[PDU]] = None):
+        """Metric families of the given readings. Whether all (or the given
+        `pdus`) PDUs could be read in time is reported as well."""
         start = time.time()
-        readings = self.read(collect_id=collect_id)
+        build_start = time.perf_counter()
         labels = ['pdu', 'label', 'type', 'connector_id']
 
         # Debug collection
-        n_families = len(readings)
-        n_metrics = sum([len(family.metrics) for family in readings])
-        n_gauges, n_counters, n_null, n_yields = (0, 0, 0, 0)
-
-        for family in readings:
-            if family.interface == 'gauge':
-                g = GaugeMetricFamily(
-                    family.name, family.description, labels=labels)
-                n_gauges += len(family.metrics)
-            elif family.interface == 'counter':
-                g = CounterMetricFamily(
-                    family.name, family.description, labels=labels)
-                n_counters += len(family.metrics)
-            else:
-                continue
+        n_metrics = sum([
+            len(r.timestamps) - r.timestamps.count(None) for r in readings])
+        n_gauges, n_counters, n_null = (0, 0, 0)
+
+        with TRACER.span('build', collect_id=collect_id):
+            # families and label values are precomputed on discovery, only the
+            # values need to be filled in
+            families = dict()
+            for r in readings:
+                values, timestamps = r.values, r.timestamps
+                for family in r.families:
+                    g = families.get(family.name)
+                    if g is None:
+                        if family.interface == 'gauge':
+                            g = GaugeMetricFamily(
+                                family.name, family.description, labels=labels)
+                        elif family.interface == 'counter':
+                            g = CounterMetricFamily(
+                                family.name, family.description, labels=labels)
+                        else:
+                            continue
+                        families[family.name] = g
+
+                    for i, label_values in zip(family.indices, family.labels):
+                        if timestamps[i] is None:
+                            continue
+                        if not isinstance(values[i], (int, float)):
+                            n_null += 1
+                            continue
+                        g.add_metric(label_values, values[i])
+                        if family.interface == 'gauge':
+                            n_gauges += 1
+                        else:
+                            n_counters += 1
 
-            for metric in family.metrics:
-                if not metric.is_numeric:
-                    n_null += 1
-                    continue
+        if INSTRUMENTATION.enabled:
+            INSTRUMENTATION.phase('build', time.perf_counter() - build_start)
+        yield from families.values()
+        n_families = n_yields = len(families)
 
-                g.add_metric([
-                    metric.pdu, metric.label, metric.type,
-                    metric.connector_id], metric.value)
+        g = GaugeMetricFamily(
+            f'{EXPORTER_PREFIX}_deadline_exceeded',
+            'Whether the PDU missed the deadline of the collection',
+            labels=['pdu'])
+        pdus = self.pdus if pdus is None else pdus
+        for pdu in pdus:
+            g.add_metric([pdu.name], int(pdu.name in missed))
+        yield g
 
-            yield g
-            n_yields += 1
+        read = {r.pdu for r in readings if not r.failed}
+        g = GaugeMetricFamily(
+            f'{EXPORTER_PREFIX}_up', 'Whether the PDU could be read',
+            labels=['pdu'])
+        for pdu in pdus:
+            g.add_metric([pdu.name], int(pdu.name in read))
+        yield g
 
         end = time.time()
         logger.debug(
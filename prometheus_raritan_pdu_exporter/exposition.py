@@ -0,0 +1,106 @@
+from typing import Callable, Dict, Iterable, NamedTuple, Tuple, Union
+import struct
+import threading
+import time
+import zlib
+
+from prometheus_client.core import Metric as PromMetric
+from prometheus_client.openmetrics.exposition import (
+    CONTENT_TYPE_LATEST as OPENMETRICS_CONTENT_TYPE)
+
+from .instrumentation import INSTRUMENTATION
+
+
+# End of an OpenMetrics exposition, which must only occur once at the end
+OPENMETRICS_EOF = b'# EOF\n'
+
+# gzip member header without a file name or modification time (RFC 1952)
+GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+
+class Deflated(NamedTuple):
+    """Raw deflate stream that another stream may be appended to, with the
+    CRC-32 and size of the uncompressed data"""
+    data: bytes
+    crc: int
+    size: int
+
+
+def deflate(data: bytes, final: bool = True) -> bytes:
+    """Raw deflate stream of `data`. Unless `final`, the stream ends with a
+    non-final block at a byte boundary, so that another stream can follow."""
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(
+        zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def gzip_member(head: Deflated, tail: bytes) -> bytes:
+    """Single gzip member of the data deflated in `head` followed by
+    `tail`"""
+    crc = zlib.crc32(tail, head.crc)
+    size = (head.size + len(tail)) & 0xffffffff
+    return b''.join((
+        GZIP_HEADER, head.data, deflate(tail), struct.pack('<II', crc, size)))
+
+
+class Exposition:
+    """Metric families of a snapshot of PDU readings, rendered at most once
+    per format and encoding and then served as is until the next snapshot
+
+    Only the families of the exporter are cached; the rest of the registry
+    (e.g., process metrics) is rendered on every request and appended.
+    Since text expositions can be concatenated and so can deflate streams
+    (if all but the last end with a flushed, non-final block), the cached
+    bytes never need to be rendered or compressed again. Compressed
+    responses are a single gzip member, as not every client (e.g., curl)
+    reads more than one."""
+    def __init__(self, families: Iterable[PromMetric]) -> None:
+        self.families = list(families)
+        self._rendered: Dict[Tuple[str, bool], Union[bytes, Deflated]] = {}
+        self._lock = threading.Lock()
+
+    def collect(self) -> Iterable[PromMetric]:
+        """Registry interface, so that the families can be passed to an
+        encoder"""
+        return iter(self.families)
+
+    def render(self, encoder: Callable, content_type: str) -> bytes:
+        """Rendered families of the snapshot, without the OpenMetrics EOF
+        marker"""
+        key = (content_type, False)
+        with self._lock:
+            if key not in self._rendered:
+                output = encoder(self)
+                if content_type == OPENMETRICS_CONTENT_TYPE:
+                    output = output[:-len(OPENMETRICS_EOF)]
+                self._rendered[key] = output
+
+            return self._rendered[key]
+
+    def deflate(self, encoder: Callable, content_type: str) -> Deflated:
+        """Rendered families of the snapshot as a deflate stream that the
+        rest of the exposition can be appended to"""
+        output = self.render(encoder, content_type)
+        key = (content_type, True)
+        with self._lock:
+            if key not in self._rendered:
+                self._rendered[key] = Deflated(
+                    data=deflate(output, final=False),
+                    crc=zlib.crc32(output), size=len(output))
+
+            return self._rendered[key]
+
+    def output(
+            self, encoder: Callable, content_type: str, registry,
+            compress: bool = False) -> bytes:
+        """Full exposition: the cached families of the snapshot followed by
+        the families of the given registry"""
+        start = time.perf_counter()
+        rest = encoder(registry)
+        if compress:
+            output = gzip_member(self.deflate(encoder, content_type), rest)
+        else:
+            output = self.render(encoder, content_type) + rest
+        if INSTRUMENTATION.enabled:
+            INSTRUMENTATION.phase('render', time.perf_counter() - start)
+        return output
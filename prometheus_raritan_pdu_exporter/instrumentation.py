@@ -0,0 +1,95 @@
+from typing import Optional
+import asyncio
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.registry import CollectorRegistry
+
+from . import EXPORTER_PREFIX
+
+# Buckets in seconds, from fast local requests to slow, large PDUs
+REQUEST_BUCKETS = (
+    .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, float('inf'))
+PHASE_BUCKETS = (
+    .0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1,
+    float('inf'))
+
+
+class Instrumentation:
+    """Metrics about the exporter itself
+
+    The metrics are only recorded (and registered) once enabled. While
+    disabled, instrumented code only checks `enabled`, so that the hot path
+    does not pay for metrics nobody collects."""
+    def __init__(self) -> None:
+        self.enabled = False
+        prefix = f'{EXPORTER_PREFIX}_exporter'
+        self.request_duration = Histogram(
+            f'{prefix}_request_duration_seconds',
+            'Duration of the requests to the PDU', ['pdu'],
+            buckets=REQUEST_BUCKETS, registry=None)
+        self.sent_bytes = Counter(
+            f'{prefix}_sent_bytes', 'Bytes sent to the PDU', ['pdu'],
+            registry=None)
+        self.received_bytes = Counter(
+            f'{prefix}_received_bytes', 'Bytes received from the PDU',
+            ['pdu'], registry=None)
+        self.requested_readings = Counter(
+            f'{prefix}_requested_readings', 'Sensor readings requested',
+            ['pdu'], registry=None)
+        self.returned_readings = Counter(
+            f'{prefix}_returned_readings', 'Sensor readings returned',
+            ['pdu'], registry=None)
+        self.phase_duration = Histogram(
+            f'{prefix}_phase_duration_seconds',
+            'Duration of the phases of a collection (http, decode, build, '
+            'render)', ['phase'], buckets=PHASE_BUCKETS,
+            registry=None)
+        self.event_loop_lag = Gauge(
+            f'{prefix}_event_loop_lag_seconds',
+            'Delay of the event loop in running a scheduled callback',
+            registry=None)
+
+    @property
+    def metrics(self) -> list:
+        return [
+            self.request_duration, self.sent_bytes, self.received_bytes,
+            self.requested_readings, self.returned_readings,
+            self.phase_duration, self.event_loop_lag]
+
+    def enable(self, registry: Optional[CollectorRegistry] = REGISTRY):
+        """Start recording the metrics, registered with `registry`"""
+        if self.enabled:
+            return
+
+        self.enabled = True
+        if registry is not None:
+            for metric in self.metrics:
+                registry.register(metric)
+
+    def request(
+            self, pdu: str, duration: float, decode: float, sent: int,
+            received: int) -> None:
+        self.request_duration.labels(pdu).observe(duration)
+        self.phase_duration.labels('http').observe(duration)
+        self.phase_duration.labels('decode').observe(decode)
+        self.sent_bytes.labels(pdu).inc(sent)
+        self.received_bytes.labels(pdu).inc(received)
+
+    def readings(self, pdu: str, requested: int, returned: int) -> None:
+        self.requested_readings.labels(pdu).inc(requested)
+        self.returned_readings.labels(pdu).inc(returned)
+
+    def phase(self, phase: str, duration: float) -> None:
+        self.phase_duration.labels(phase).observe(duration)
+
+    async def monitor_event_loop(self, interval: float = 1) -> None:
+        """Measure how late the running event loop wakes up from sleeping
+        for `interval` seconds, e.g., because of blocking callbacks"""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.event_loop_lag.set(max(loop.time() - start - interval, 0))
+
+
+INSTRUMENTATION = Instrumentation()
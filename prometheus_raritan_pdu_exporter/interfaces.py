@@ -1,15 +1,20 @@
 from __future__ import annotations
 from dataclasses import dataclass, field, InitVar
-from typing import Optional, Union, List, Dict, Any
+from functools import partial
+from typing import Optional, Union, List, Dict, Any, Tuple, ClassVar, Set
 from aiohttp.client_exceptions import ClientConnectorError
-import logging
+import asyncio
 import re
+import time
 
 from . import (
     logger, EXPORTER_PREFIX, SENSORS_TYPES, SENSORS_UNITS,
     SENSORS_DESCRIPTION, SENSORS_GAUGES, SENSORS_COUNTERS)
-from .jsonrpc import Request, RaritanAuth, EmptyResponse
-from .debug import debug_responses, debug_responses_named
+from .jsonrpc import (
+    Request, RaritanAuth, RaritanSession, EmptyResponse, ReadingResponses,
+    RequestLimit)
+from .instrumentation import INSTRUMENTATION
+from .tracing import TRACER
 
 
 class InterfaceError(Exception):
@@ -24,15 +29,144 @@ class MetricMismatchError(Exception):
         super().__init__(message)
 
 
+@dataclass
+class BatchSize:
+    """Number of sensor readings requested per bulk request
+
+    Without a `maximum`, all readings of a PDU are requested at once. With a
+    target `latency` (in seconds), the batch size is tuned to the observed
+    response times of the PDU, so that each request takes about as long as
+    the target."""
+    maximum: Optional[int] = None
+    latency: Optional[float] = None
+    minimum: int = 16
+
+    # exponentially weighted moving average of seconds per reading
+    per_reading: Optional[float] = field(init=False, default=None)
+    smoothing: float = field(init=False, default=0.3, repr=False)
+
+    def size(self, n_readings: int) -> int:
+        size = self.maximum or n_readings
+        if self.latency and self.per_reading:
+            size = min(size, max(
+                int(self.latency / self.per_reading), self.minimum))
+        return max(min(size, n_readings), 1)
+
+    def update(self, n_readings: int, duration: float) -> None:
+        """Record the response time of a request for `n_readings`"""
+        if n_readings == 0:
+            return
+
+        sample = duration / n_readings
+        if self.per_reading is None:
+            self.per_reading = sample
+        else:
+            self.per_reading += self.smoothing * (sample - self.per_reading)
+
+
+@dataclass
+class CircuitBreaker:
+    """Stops reading a PDU after `threshold` consecutive failed reads
+
+    While the breaker is open, reads are skipped, except for a single read
+    after a backoff delay that doubles (from `delay` up to `max_delay`
+    seconds) after every further failure. The first successful read closes
+    the breaker again. Without a `threshold`, reads are never skipped."""
+    threshold: Optional[int] = None
+    delay: float = 10
+    max_delay: float = 600
+
+    failures: int = field(init=False, default=0)
+    backoff: float = field(init=False, default=0)
+    retry_at: float = field(init=False, default=0)
+
+    @property
+    def is_open(self) -> bool:
+        return self.threshold is not None and self.failures >= self.threshold
+
+    def allow(self, now: float) -> bool:
+        """Whether to read the PDU, reserving the retry of an open breaker
+        for a single read"""
+        if not self.is_open:
+            return True
+        if now < self.retry_at:
+            return False
+
+        self.retry_at = now + self.backoff
+        return True
+
+    def success(self) -> None:
+        self.failures = 0
+        self.backoff = 0
+
+    def failure(self, now: float) -> None:
+        self.failures += 1
+        if self.is_open:
+            self.backoff = min(
+                self.backoff * 2 if self.backoff else self.delay,
+                self.max_delay)
+            self.retry_at = now + self.backoff
+
+
+@dataclass
+class Schedule:
+    """Intervals in seconds at which sensors are read, by metric family
+    name (e.g., raritanpdu_activeenergy_watthour_total) or sensor type
+    (e.g., temperature). Sensors without an interval are read on every
+    poll."""
+    intervals: Dict[str, float] = field(default_factory=dict)
+
+    @staticmethod
+    def names(sensor: Sensor) -> Tuple[str, str]:
+        """Metric family and sensor type of the sensor, the names its
+        interval may be given for"""
+        metric = sensor.spec['name'] or SENSORS_TYPES[sensor.spec['metric']]
+        return sensor.name, metric.lower()
+
+    def interval(self, sensor: Sensor) -> float:
+        family, metric = self.names(sensor)
+        return self.intervals.get(family, self.intervals.get(metric, 0))
+
+    def unmatched(self, sensors: List[Sensor]) -> Set[str]:
+        """Names of the intervals that match none of the sensors"""
+        names = {name for sensor in sensors for name in self.names(sensor)}
+        return set(self.intervals) - names
+
+
 @dataclass
 class PDU:
     auth: RaritanAuth = field(repr=False)
+    batch: BatchSize = field(
+        default_factory=BatchSize, repr=False, compare=False)
 
     name: str = field(init=False)
     connectors: list[Connector] = field(
         default_factory=list, init=False, repr=False)
     poles: list[Pole] = field(default_factory=list, init=False, repr=False)
     sensors: list[Sensor] = field(default_factory=list, init=False, repr=False)
+    families: list[SensorFamily] = field(
+        default_factory=list, init=False, repr=False, compare=False)
+
+    schedule: Schedule = field(
+        default_factory=Schedule, repr=False, compare=False)
+    breaker: CircuitBreaker = field(
+        default_factory=CircuitBreaker, repr=False, compare=False)
+
+    # read interval of every sensor and when it is due to be read next
+    intervals: List[float] = field(
+        default_factory=list, init=False, repr=False, compare=False)
+    due: List[float] = field(
+        default_factory=list, init=False, repr=False, compare=False)
+
+    # latest readings, used for the sensors that are not due
+    latest: Optional[Readings] = field(
+        default=None, init=False, repr=False, compare=False)
+
+    # serialized reading requests per batch, by batch size and due sensors,
+    # reset whenever the sensors change
+    bodies: Dict[tuple, List[Optional[bytes]]] = field(
+        default_factory=dict, init=False, repr=False, compare=False)
+    max_bodies: ClassVar[int] = 16
 
     n_inlets: int = field(init=False, default=0)
     n_outlets: int = field(init=False, default=0)
@@ -40,83 +174,313 @@ class PDU:
     n_devices: int = field(init=False, default=0)
     n_poles: int = field(init=False, default=0)
 
+    session: Optional[RaritanSession] = field(
+        init=False, default=None, repr=False, compare=False)
+
     def __post_init__(self):
         super().__setattr__('name', self.auth.name)
 
+    def open(
+            self, max_requests: Optional[int] = None,
+            shared: Optional[RequestLimit] = None) -> None:
+        """Reuse a long-lived session for all requests to the PDU instead
+        of connecting anew for every request. At most `max_requests` are
+        sent to the PDU at the same time, and requests to all PDUs may be
+        limited by a `shared` limit."""
+        if self.session is None:
+            self.session = RaritanSession(
+                self.auth, limit=RequestLimit(max_requests), shared=shared)
+
+    async def close(self) -> None:
+        """Close the connections held by the long-lived session"""
+        if self.session is not None:
+            await self.session.close()
+
     async def setup(self):
         try:
-            await self._connectors()
-            await self._sensors()
-
-            self.n_poles = len(self.poles)
-            self.n_sensors = len(self.sensors)
-            self.n_inlets = len(
-                [c for c in self.connectors if c.type == 'inlet'])
-            self.n_outlets = len(
-                [c for c in self.connectors if c.type == 'outlet'])
-            self.n_devices = len(
-                [c for c in self.connectors if c.type == 'device'])
+            self.update(*await self.discover())
             logger.info(self)
         except ClientConnectorError as e:
             # Ignore PDUs that fail to connect
             logger.warning(e)
             return
+        except Exception as exc:
+            # ...or fail to answer any of the discovery requests
+            logger.warning(f'({self.name}) Discovery failed: {exc}')
+            return
+
+    async def discover(self) -> Tuple[
+            List[Connector], List[Pole], List[Sensor]]:
+        """Discover the connectors, poles and sensors of the PDU without
+        changing its current topology"""
+        with TRACER.trace('discover', pdu=self.name):
+            connectors = await self._connector_rids()
+            connectors, poles, sensors = await self._connector_details(
+                connectors)
+            sensors = await self._sensor_metadata(sensors)
+        return connectors, poles, [Sensor(**sensor) for sensor in sensors]
+
+    async def rediscover(self) -> bool:
+        """Discover the topology anew and swap in any changes, keeping the
+        current topology if discovery fails"""
+        try:
+            topology = await self.discover()
+        except Exception as exc:
+            logger.warning(f'({self.name}) Rediscovery failed: {exc}')
+            return False
+
+        return self.update(*topology)
+
+    def update(
+            self, connectors: List[Connector], poles: List[Pole],
+            sensors: List[Sensor]) -> bool:
+        """Swap in a discovered topology. Connectors, poles and sensors that
+        did not change are kept as they are. Returns whether anything
+        changed."""
+        def merge(current: list, discovered: list, key) -> list:
+            known = {key(item): item for item in current}
+            return [known.get(key(item), item) for item in discovered]
+
+        def parent_key(parent: Union[Pole, Connector]) -> tuple:
+            return parent.type, parent.id, parent.name
+
+        connectors = merge(
+            self.connectors, connectors,
+            lambda c: (c.rid, c.type, c.id, c.name))
+        poles = merge(self.poles, poles, lambda p: (p.id, p.name))
+        sensors = merge(
+            self.sensors, sensors,
+            lambda s: (s.rid, s.name, s.interface, parent_key(s.parent)))
+
+        # new sensors of kept connectors and poles still point at the
+        # discovered ones, which are dropped
+        parents = {parent_key(p): p for p in [*connectors, *poles]}
+        for i, sensor in enumerate(sensors):
+            parent = parents.get(parent_key(sensor.parent), sensor.parent)
+            if parent is not sensor.parent:
+                sensors[i] = Sensor(**sensor.spec, parent=parent)
+
+        changes = {
+            name: (len(set(map(id, new)) - set(map(id, old))),
+                   len(set(map(id, old)) - set(map(id, new))))
+            for name, old, new in (
+                ('connectors', self.connectors, connectors),
+                ('poles', self.poles, poles),
+                ('sensors', self.sensors, sensors))}
+        changed = any(
+            added or removed for added, removed in changes.values())
+
+        if changed and self.is_discovered:
+            logger.info(f"({self.name}) Topology changed: " + ', '.join(
+                f'+{added}/-{removed} {name}'
+                for name, (added, removed) in changes.items()))
+
+        # replace whole lists so that running reads are not affected
+        self.connectors = connectors
+        self.poles = poles
+        if len(sensors) != len(self.sensors) or any(
+                a is not b for a, b in zip(sensors, self.sensors)):
+            self.sensors = sensors
+            self.families = SensorFamily.group(sensors)
+            self.intervals = [self.schedule.interval(s) for s in sensors]
+            self.due = [0.0] * len(sensors)
+            self.bodies = {}
+        self.n_poles = len(poles)
+        self.n_sensors = len(sensors)
+        self.n_inlets = len([c for c in connectors if c.type == 'inlet'])
+        self.n_outlets = len([c for c in connectors if c.type == 'outlet'])
+        self.n_devices = len([c for c in connectors if c.type == 'device'])
+        return changed
+
+    def topology(self) -> Dict[str, Any]:
+        """JSON-serializable topology of the PDU"""
+        parents = {
+            **{id(c): ['connectors', i]
+               for i, c in enumerate(self.connectors)},
+            **{id(p): ['poles', i] for i, p in enumerate(self.poles)}}
+        return dict(
+            url=self.auth.url,
+            connectors=[
+                dict(rid=c.rid, id=c.id, name=c.name, type=c.type)
+                for c in self.connectors],
+            poles=[dict(id=p.id, name=p.name) for p in self.poles],
+            sensors=[
+                dict(**s.spec, parent=parents[id(s.parent)])
+                for s in self.sensors])
+
+    def restore(self, topology: Dict[str, Any]) -> None:
+        """Restore a topology created by `topology()`"""
+        if topology['url'] != self.auth.url:
+            raise ValueError(
+                f"Topology of {topology['url']} cannot be restored for "
+                f"{self.auth.url}")
+
+        parents = dict(
+            connectors=[
+                Connector(pdu=self, **c) for c in topology['connectors']],
+            poles=[Pole(pdu=self, **p) for p in topology['poles']])
+        sensors = []
+        for sensor in topology['sensors']:
+            kind, i = sensor['parent']
+            sensors.append(Sensor(**{**sensor, 'parent': parents[kind][i]}))
+
+        self.update(parents['connectors'], parents['poles'], sensors)
+
+    @property
+    def is_discovered(self) -> bool:
+        return len(self.connectors) + len(self.sensors) + len(self.poles) > 0
 
     async def read(self, collect_id: str = '-') -> list[Metric]:
-        """Request sensor readings"""
-        metrics = []
-        request = Request(self.auth, collect_id=collect_id)
-        for i, sensor in enumerate(self.sensors):
-            request.add(rid=sensor.rid, method='getReading', id=i)
+        """Request sensor readings as `Metric` objects"""
+        readings = await self.read_values(collect_id=collect_id)
+        return [
+            Metric(sensor=sensor, value=value, timestamp=timestamp)
+            for sensor, value, timestamp in zip(
+                readings.sensors, readings.values, readings.timestamps)
+            if timestamp is not None]
+
+    async def read_values(self, collect_id: str = '-') -> Readings:
+        """Request the readings of all sensors that are due, split into
+        concurrent bulk requests of at most `batch.size()` readings each.
+        Values are stored in slots aligned with the sensors of the PDU;
+        sensors that are not due keep their latest reading, sensors without
+        a reading have no timestamp."""
+        with TRACER.span('read', collect_id=collect_id, pdu=self.name):
+            return await self._read_due(collect_id=collect_id)
+
+    async def _read_due(self, collect_id: str = '-') -> Readings:
+        # the topology may change during the read
+        sensors, families, bodies = self.sensors, self.families, self.bodies
+        intervals, due, latest = self.intervals, self.due, self.latest
+        now = time.monotonic()
+        if not self.breaker.allow(now):
+            logger.debug(
+                f'({self.name}#{collect_id}) Skipped reading, PDU is down')
+            return Readings(
+                sensors=sensors, families=families,
+                values=[None] * len(sensors),
+                timestamps=[None] * len(sensors), pdu=self.name,
+                failed=True)
+
+        if latest is not None and latest.sensors is sensors and any(
+                intervals):
+            indices = [i for i, t in enumerate(due) if t <= now]
+            readings = Readings(
+                sensors=sensors, families=families,
+                values=list(latest.values),
+                timestamps=list(latest.timestamps), pdu=self.name)
+            for i in indices:
+                readings.values[i] = readings.timestamps[i] = None
+        else:
+            indices = list(range(len(sensors)))
+            readings = Readings(
+                sensors=sensors, families=families,
+                values=[None] * len(sensors),
+                timestamps=[None] * len(sensors), pdu=self.name)
+
+        size = self.batch.size(len(indices))
+        batches = [
+            indices[i:i + size] for i in range(0, len(indices), size)]
+
+        # request bodies are kept for a few combinations of batch size and
+        # due sensors, which repeat as long as the topology does not change
+        key = (size, None if len(indices) == len(sensors) else tuple(indices))
+        if key not in bodies:
+            if len(bodies) >= self.max_bodies:
+                bodies.clear()
+            bodies[key] = [None] * len(batches)
+
+        results = await asyncio.gather(*[
+            self._read_batch(
+                sensors, batch, readings, bodies=bodies[key], n=n,
+                collect_id=collect_id)
+            for n, batch in enumerate(batches)])
+        response_ids = [i for ids in results if ids for i in ids]
+        readings.failed = bool(batches) and all(
+            ids is None for ids in results)
+        if batches:
+            # reads without any due sensor tell nothing about the PDU
+            self.record(readings.failed)
+        if INSTRUMENTATION.enabled:
+            INSTRUMENTATION.readings(
+                self.name, requested=len(indices),
+                returned=len(response_ids))
+
+        if len(indices) > len(response_ids):
+            logger.debug(
+                f'({self.name}#{collect_id}) API request returned '
+                f'{len(response_ids)} readings for {len(indices)} due '
+                f'sensors in {len(batches)} request{"s"[:len(batches)^1]}')
+
+        # sensors are due again after their interval
+        if len(due) == len(sensors):
+            for i in response_ids:
+                due[i] = now + intervals[i]
+        self.latest = readings
+
+        TRACER.tag(
+            requested=len(indices), returned=len(response_ids),
+            batches=len(batches), failed=readings.failed)
+        TRACER.missing(
+            'reading', requested=indices, returned=response_ids,
+            source=self.name, collect_id=collect_id,
+            name=lambda i: sensors[i].rid)
+        return readings
+
+    def record(self, failed: bool) -> None:
+        """Record the outcome of a read in the circuit breaker"""
+        was_open = self.breaker.is_open
+        if failed:
+            self.breaker.failure(time.monotonic())
+        else:
+            self.breaker.success()
+
+        if self.breaker.is_open and not was_open:
+            logger.warning(
+                f'({self.name}) Marked down after {self.breaker.failures} '
+                f'failed reads, retrying in {self.breaker.backoff:.0f}s')
+        elif was_open and not self.breaker.is_open:
+            logger.warning(f'({self.name}) Back up, resuming reads')
+
+    async def _read_batch(
+            self, sensors: List[Sensor], indices: List[int],
+            readings: Readings, bodies: Optional[List[Optional[bytes]]] = None,
+            n: int = 0, collect_id: str = '-') -> Optional[List[int]]:
+        """Read the sensors at the given positions into their slots of
+        `readings`, returns the positions of the sensors that returned a
+        reading, or None if the request failed. The serialized request is
+        stored in (and reused from) the `n`th of `bodies`."""
+        body = bodies[n] if bodies is not None else None
+        request = Request(
+            self.auth, collect_id=collect_id, session=self.session,
+            body=body, size=len(indices))
+        if body is None:
+            for i in indices:
+                request.add(rid=sensors[i].rid, method='getReading', id=i)
+            if bodies is not None:
+                bodies[n] = request.body
 
         try:
-            result = await request.send()
+            result = await request.send(parse=partial(
+                ReadingResponses, values=readings.values,
+                timestamps=readings.timestamps))
         except Exception as exc:
             logger.error(
                 f'({self.name}#{collect_id}) Uncaught Exception: {exc}')
-        else:
-            # note: EmptyResponse return value is fine during reads
-            if len(self.sensors) > len(result.responses):
-                logger.debug(
-                    f'({self.name}#{collect_id}) API request returned '
-                    f'{len(result.responses)} readings for '
-                    f'{self.n_sensors} known sensors')
-
-            for resp in result.responses:
-                metric = Metric(
-                    sensor=self.sensors[int(resp.id)],
-                    value=resp.ret['value'],
-                    timestamp=resp.ret['timestamp'])
-                metrics.append(metric)
-
-            # Debug: No responses received for these sensors
-            if logging.DEBUG >= logger.level:
-                debug_responses(
-                    requests=[s.name for s in self.sensors],
-                    response_ids=[resp.id for resp in result.responses],
-                    collect_id=collect_id)
-
-        return metrics
-
-    async def _connectors(self) -> None:
-        connectors = await self._connector_rids()
-        connectors = await self._connector_metadata(connectors)
-        connectors = await self._connector_settings(connectors)
-        self.connectors = [Connector(**c) for c in connectors]
-
-    async def _sensors(self) -> None:
-        if len(self.connectors) == 0:
-            raise ValueError('Cannot get sensors without connector meta-data')
+            return None
 
-        sensors_pole = await self._sensors_from_poles()
-        sensors_con = await self._sensors_from_connectors(self.connectors)
-        sensors = [*sensors_pole, *sensors_con]
-        sensors = await self._sensor_metadata(sensors)
-        self.sensors = [Sensor(**sensor) for sensor in sensors]
+        # note: EmptyResponse return value is fine during reads
+        if isinstance(result, EmptyResponse):
+            return None
+
+        # time spent waiting for a request slot is not the PDU's
+        if request.duration is not None:
+            self.batch.update(len(indices), request.duration)
+        return result.ids
 
     async def _connector_rids(self) -> List[Dict[str, Any]]:
         """get connector rids"""
-        request = Request(self.auth)
+        request = Request(self.auth, session=self.session)
         request.add(rid='/model/pdu/0', method='getInlets', id='inlet')
         request.add(rid='/model/pdu/0', method='getOutlets', id='outlet')
         request.add(
@@ -132,154 +496,126 @@ class PDU:
             dict(pdu=self, rid=response.ret['rid'], type=response.id)
             for response in result.responses]
 
-        # Debug: No responses received for these connectors
-        if logging.DEBUG >= logger.level:
-            debug_responses_named(
-                requests=['inlet', 'outlet', 'device'],
-                response_ids=[resp.id for resp in result.responses])
+        TRACER.missing(
+            'connector', requested=['inlet', 'outlet', 'device'],
+            returned=[resp.id for resp in result.responses], source=self.name)
 
         return connectors
 
-    async def _connector_metadata(
-            self, connectors: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        request = Request(self.auth)
-        for i, c in enumerate(connectors):
-            if c['type'] == 'device':  # devices have no metadata
-                continue
-            request.add(rid=c['rid'], method='getMetaData', id=i)
-
-        result = await request.send()
-        if isinstance(result, EmptyResponse):
-            # EmptyResponses are not acceptable during setup
-            raise result.exception
-
-        for resp in result.responses:
-            connectors[resp.id]['id'] = resp.ret.get('label', None)
-
-        # Debug: No responses received for these connectors
-        if logging.DEBUG >= logger.level:
-            debug_responses(
-                requests=[
-                    c['rid'].rsplit('/', 1)[-1] for c in connectors
-                    if c['type'] != 'device'],
-                response_ids=[resp.id for resp in result.responses])
+    async def _connector_details(
+            self, connectors: List[Dict[str, Any]]
+    ) -> Tuple[List[Connector], List[Pole], List[Dict[str, Any]]]:
+        """get connector metadata, settings, poles and sensors
 
-        return connectors
+        These only depend on the connector rids, so they are requested in a
+        single bulk request with ids of the form `<connector index>:<method>`
+        """
+        if len(connectors) == 0:
+            raise ValueError('Cannot get sensors without connector meta-data')
 
-    async def _connector_settings(
-            self, connectors: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        request = Request(self.auth)
+        sensor_methods = {
+            'inlet': 'getSensors', 'outlet': 'getSensors',
+            'device': 'getDevice'}
+        request = Request(self.auth, session=self.session)
         for i, c in enumerate(connectors):
-            request.add(rid=c['rid'], method='getSettings', id=i)
+            methods = ['getSettings', sensor_methods[c['type']]]
+            if c['type'] != 'device':  # devices have no metadata
+                methods.insert(0, 'getMetaData')
+            if c['type'] == 'inlet':
+                methods.append('getPoles')
+
+            for method in methods:
+                request.add(rid=c['rid'], method=method, id=f'{i}:{method}')
 
         result = await request.send()
         if isinstance(result, EmptyResponse):
             # EmptyResponses are not acceptable during setup
             raise result.exception
 
+        responses = []
         for resp in result.responses:
-            connectors[resp.id]['name'] = resp.ret.get('name', None)
+            i, method = resp.id.split(':', 1)
+            responses.append((int(i), method, resp.ret))
 
-        # Debug: No responses received for these connectors
-        if logging.DEBUG >= logger.level:
-            from .debug import debug_responses
-            debug_responses(
-                requests=[c['rid'] for c in connectors],
-                response_ids=[resp.id for resp in result.responses])
+        for i, method, ret in responses:
+            if method == 'getMetaData':
+                connectors[i]['id'] = ret.get('label', None)
+            elif method == 'getSettings':
+                connectors[i]['name'] = ret.get('name', None)
 
-        return connectors
-
-    async def _sensors_from_poles(self) -> List[Dict[str, Any]]:
-        sensors = []
+        connectors = [Connector(**c) for c in connectors]
         poles = []
-        inlets = [c for c in self.connectors if c.type == 'inlet']
-        request = Request(self.auth)
-
-        for i, c in enumerate(inlets):
-            request.add(rid=c.rid, method='getPoles', id=i)
-
-        result = await request.send()
-        if isinstance(result, EmptyResponse):
-            # EmptyResponses are not acceptable during setup
-            raise result.exception
+        sensors_pole = []
+        sensors_con = []
+        for i, method, ret in responses:
+            if method == 'getPoles':
+                poles.append(Pole(
+                    pdu=self, name=ret['label'], id=ret['nodeId']))
+                sensors_pole.extend(self._pole_sensors(poles[-1], ret))
+            elif method in ['getSensors', 'getDevice']:
+                sensors_con.extend(self._connector_sensors(connectors[i], ret))
 
-        for resp in result.responses:
-            poles.append(Pole(
-                pdu=self, name=resp.ret['label'], id=resp.ret['nodeId']))
-
-            for name, ret in resp.ret.items():
-                non_metrics = ['label', 'line', 'nodeId']
-                if name not in non_metrics and ret is not None:
-                    sensors.append(
-                        dict(rid=ret['rid'], interface=ret['type'],
-                             parent=poles[-1], name=name))
+        methods = {
+            r['json']['id']: f"{r['rid']}:{r['json']['method']}"
+            for r in request.requests}
+        TRACER.missing(
+            'detail', requested=list(methods),
+            returned=[resp.id for resp in result.responses], source=self.name,
+            name=methods.get)
 
-        self.poles = poles
+        return connectors, poles, [*sensors_pole, *sensors_con]
 
-        # Debug: No responses received for these connectors
-        if logging.DEBUG >= logger.level:
-            debug_responses(
-                requests=[c.name for c in inlets],
-                response_ids=[resp.id for resp in result.responses])
+    @staticmethod
+    def _pole_sensors(
+            pole: Pole, ret: Dict[str, Any]) -> List[Dict[str, Any]]:
+        sensors = []
+        for name, sensor in ret.items():
+            non_metrics = ['label', 'line', 'nodeId']
+            if name not in non_metrics and sensor is not None:
+                sensors.append(
+                    dict(rid=sensor['rid'], interface=sensor['type'],
+                         parent=pole, name=name))
 
         return sensors
 
-    async def _sensors_from_connectors(
-            self, connectors: List[Connector]) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _connector_sensors(
+            connector: Connector, ret: Optional[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
         sensors = []
-        methods = {
-            'inlet': 'getSensors', 'outlet': 'getSensors',
-            'device': 'getDevice'}
-        request = Request(self.auth)
-        for i, c in enumerate(connectors):
-            request.add(rid=c.rid, method=methods[c.type], id=i)
-
-        result = await request.send()
-        if isinstance(result, EmptyResponse):
-            # EmptyResponses are not acceptable during setup
-            raise result.exception
-
-        for resp in result.responses:
-            connector = connectors[resp.id]
-            if connector.type == 'device':
-                if resp.ret is None:
+        if connector.type == 'device':
+            if ret is None:
+                return sensors
+
+            ret = ret.get('value', {}).get('device', None)
+            base_type = ret.get('type', '').split(':')[0]
+            if base_type not in [*SENSORS_GAUGES, *SENSORS_COUNTERS]:
+                # ignore state sensors
+                return sensors
+
+            sensors.append(dict(
+                rid=ret['rid'], interface=ret['type'], parent=connector))
+
+        elif connector.type in ['inlet', 'outlet']:
+            for name, sensor in ret.items():
+                if sensor is None:
                     continue
 
-                ret = resp.ret.get('value', {}).get('device', None)
-                base_type = ret.get('type', '').split(':')[0]
+                base_type = sensor.get('type', '').split(':')[0]
                 if base_type not in [*SENSORS_GAUGES, *SENSORS_COUNTERS]:
                     # ignore state sensors
                     continue
 
                 sensors.append(dict(
-                    rid=ret['rid'], interface=ret['type'], parent=connector))
-
-            elif connector.type in ['inlet', 'outlet']:
-                for name, ret in resp.ret.items():
-                    if ret is None:
-                        continue
-
-                    base_type = ret.get('type', '').split(':')[0]
-                    if base_type not in [*SENSORS_GAUGES, *SENSORS_COUNTERS]:
-                        # ignore state sensors
-                        continue
-
-                    sensors.append(dict(
-                        rid=ret['rid'], interface=ret['type'],
-                        parent=connector, name=name))
-
-        # Debug: No responses received for these connectors
-        if logging.DEBUG >= logger.level:
-            debug_responses(
-                requests=[c.name for c in connectors],
-                response_ids=[resp.id for resp in result.responses])
+                    rid=sensor['rid'], interface=sensor['type'],
+                    parent=connector, name=name))
 
         return sensors
 
     async def _sensor_metadata(
             self, sensors: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """get sensor metadata"""
-        request = Request(self.auth)
+        request = Request(self.auth, session=self.session)
         for i, sensor in enumerate(sensors):
             request.add(rid=sensor['rid'], method='getMetaData', id=i)
 
@@ -293,11 +629,10 @@ class PDU:
             sensors[resp.id]['metric'] = ret.get('type', 0)
             sensors[resp.id]['unit'] = ret.get('unit', 0)
 
-        # Debug: No responses received for these sensors
-        if logging.DEBUG >= logger.level:
-            debug_responses(
-                requests=[s['rid'].rsplit('/', 1)[-1] for s in sensors],
-                response_ids=[resp.id for resp in result.responses])
+        TRACER.missing(
+            'metadata', requested=range(len(sensors)),
+            returned=[resp.id for resp in result.responses], source=self.name,
+            name=lambda i: sensors[i]['rid'])
 
         return sensors
 
@@ -339,7 +674,18 @@ class Sensor:
     name: str = field(default=None)
     parent: Union[Pole, Connector] = field(default=None)
 
+    # arguments the sensor was created with, used to restore it from cache
+    spec: Dict[str, Any] = field(
+        init=False, default=None, repr=False, compare=False)
+
+    # label values (pdu, label, type, connector_id) of the sensor's metric
+    labels: Tuple[str, str, str, str] = field(
+        init=False, default=None, repr=False, compare=False)
+
     def __post_init__(self, metric: int, unit: int):
+        super().__setattr__('spec', dict(
+            rid=self.rid, interface=self.interface, metric=metric, unit=unit,
+            name=self.name))
         metric = SENSORS_TYPES[metric] if self.name is None else self.name
         metric = metric.lower()
         unit = SENSORS_UNITS[unit]
@@ -356,6 +702,12 @@ class Sensor:
 
         super().__setattr__('name', name)
 
+        if self.parent is not None:
+            # properties used for label values must be of type str
+            super().__setattr__('labels', (
+                str(self.parent.pdu.name), str(self.parent.name),
+                str(self.parent.type), str(self.parent.id)))
+
         if metric == 'unspecified':
             logger.debug(f'Sensor \'{self.name}\' is of unspecified type')
 
@@ -367,6 +719,44 @@ class Sensor:
         return label
 
 
+@dataclass(frozen=True)
+class SensorFamily:
+    """Sensors of a PDU that share a metric family, precomputed on discovery
+    so that readings do not need to be grouped on every scrape"""
+    name: str
+    interface: str
+    description: str
+    indices: Tuple[int, ...]  # positions of the sensors in PDU.sensors
+    labels: Tuple[Tuple[str, str, str, str], ...]
+
+    @classmethod
+    def group(cls, sensors: List[Sensor]) -> List[SensorFamily]:
+        groups = {}
+        for i, sensor in enumerate(sensors):
+            groups.setdefault(sensor.name, []).append(i)
+
+        return [
+            cls(name=name, interface=sensors[indices[0]].interface,
+                description=SENSORS_DESCRIPTION.get(name, 'none'),
+                indices=tuple(indices),
+                labels=tuple(sensors[i].labels for i in indices))
+            for name, indices in groups.items()]
+
+
+@dataclass
+class Readings:
+    """Sensor readings of a PDU, aligned with the sensors they were read
+    from"""
+    sensors: List[Sensor] = field(repr=False)
+    families: List[SensorFamily] = field(repr=False)
+    values: List[Optional[Union[int, float]]]
+    timestamps: List[Optional[Union[int, float]]]
+
+    # name of the PDU and whether it failed to respond (or was skipped)
+    pdu: Optional[str] = None
+    failed: bool = False
+
+
 @dataclass
 class Metric:
     sensor: InitVar[Sensor]
@@ -1,14 +1,43 @@
+from contextlib import asynccontextmanager
 from dataclasses import dataclass, field, InitVar
-from typing import Union, Dict, Any
+from functools import lru_cache
+from typing import Optional, Union, Dict, Any, Callable, List
 from urllib.parse import urljoin
-from ssl import SSLCertVerificationError
+from ssl import (
+    SSLCertVerificationError, SSLContext, CERT_NONE, create_default_context)
 from urllib.parse import urlparse, urlunparse
+import asyncio
+import json as jsonlib
+import time
 
 from aiohttp import (
-    BasicAuth, ClientSession, ClientTimeout, TCPConnector, ServerTimeoutError)
+    BasicAuth, ClientSession, ClientTimeout, TCPConnector, ServerTimeoutError,
+    ServerDisconnectedError)
 from aiohttp.web import HTTPException
 
 from . import logger
+from .instrumentation import INSTRUMENTATION
+from .tracing import TRACER
+
+try:
+    # optional, considerably faster decoding of large (reading) responses
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def loads(data: bytes) -> Any:
+    """Decode a JSON document, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return jsonlib.loads(data)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode a JSON document, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return jsonlib.dumps(obj).encode()
 
 
 class JSONRPCError(Exception):
@@ -41,23 +70,28 @@ class Response(object):
             self.ret = self.ret[0]
 
 
+def bulk_responses(json: dict) -> List[dict]:
+    """Responses to the requests of a performBulk call"""
+    if 'error' in json.keys():
+        raise JSONRPCError(json['error']['message'])
+
+    if 'result' not in json.keys():
+        raise JSONRPCError('Missing \'result\' key in json')
+
+    responses = json['result'].get('responses', [])
+    if not responses:
+        raise JSONRPCError('No responses returned')
+
+    return responses
+
+
 @dataclass
 class Responses(object):
     json: InitVar[dict]
     responses: list = field(init=False, default_factory=list)
 
     def __post_init__(self, json: dict):
-        if 'error' in json.keys():
-            raise JSONRPCError(json['error']['message'])
-
-        if 'result' not in json.keys():
-            raise JSONRPCError('Missing \'result\' key in json')
-
-        responses = json['result'].get('responses', [])
-        if not responses:
-            raise JSONRPCError('No responses returned')
-
-        for response in responses:
+        for response in bulk_responses(json):
             json = response.get('json', {})
             if not json:
                 raise JSONRPCError('Missing \'json\' key in response')
@@ -79,6 +113,48 @@ class Responses(object):
                 self.responses.append(Response(id=id, ret=ret))
 
 
+@dataclass
+class ReadingResponses(object):
+    """Responses to getReading requests, decoded without creating a
+    `Response` per reading. The value and timestamp of each reading are
+    stored in `values` and `timestamps` at the position given by the
+    (integer) request id. If the response turns out to be invalid, the
+    readings already stored are cleared again."""
+    json: InitVar[dict]
+    values: list = field(repr=False)
+    timestamps: list = field(repr=False)
+    ids: List[int] = field(init=False, default_factory=list)
+
+    def __post_init__(self, json: dict):
+        values, timestamps, ids = self.values, self.timestamps, self.ids
+        try:
+            for response in bulk_responses(json):
+                json = response.get('json')
+                if not json:
+                    raise JSONRPCError('Missing \'json\' key in response')
+
+                error = json.get('error')
+                if error:
+                    logger.error(
+                        f"Response (id: {json.get('id')}): "
+                        f"{error['message']}")
+                    continue
+
+                ret = json.get('result', {}).get('_ret_')
+                if not ret:
+                    continue
+
+                i = int(json['id'])
+                values[i], timestamps[i] = ret['value'], ret['timestamp']
+                ids.append(i)
+        except Exception:
+            # the batch failed as a whole, none of its readings are served
+            for i in ids:
+                values[i] = timestamps[i] = None
+            ids.clear()
+            raise
+
+
 @dataclass(frozen=True)
 class RaritanAuth:
     name: str
@@ -113,12 +189,113 @@ class RaritanAuth:
         super().__setattr__('url', urlunparse(url))
 
 
+class RequestLimit:
+    """Maximum number of requests in flight at the same time, without a
+    `limit` requests are not limited. The semaphore is created lazily, as it
+    must be bound to a running event loop."""
+    def __init__(self, limit: Optional[int] = None):
+        if limit is not None and limit < 1:
+            raise ValueError(f'At least 1 request is required, got {limit}')
+
+        self.limit = limit
+        self._semaphore = None
+
+    async def __aenter__(self):
+        if self.limit is not None:
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.limit)
+            await self._semaphore.acquire()
+
+    async def __aexit__(self, *exc_info):
+        if self.limit is not None:
+            self._semaphore.release()
+
+
+class RaritanSession:
+    """Long-lived HTTP session to a single PDU
+
+    The underlying `aiohttp.ClientSession` keeps connections to the PDU alive
+    between requests, caches DNS lookups and reuses a single SSL context, so
+    that the TCP and TLS handshakes are not repeated for every request. The
+    client session is created lazily, as it must be bound to a running event
+    loop."""
+    # seconds an idle connection is kept open for reuse
+    keepalive_timeout = 60
+
+    # seconds a resolved PDU address is cached
+    dns_cache_ttl = 300
+
+    def __init__(
+            self, auth: RaritanAuth, timeout: float = 10,
+            limit: Optional[RequestLimit] = None,
+            shared: Optional[RequestLimit] = None):
+        self.auth = auth
+        self.url = urljoin(auth.url, '/bulk')
+        self.timeout = timeout
+        # certificates have never been verified, regardless of `verify_ssl`
+        # (which is rewritten to None), and PDUs commonly use self-signed
+        # ones
+        self.ssl = self.ssl_context(verify=False)
+        self.limit = limit or RequestLimit()
+        self.shared = shared or RequestLimit()
+        self._session = None
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def ssl_context(verify: bool) -> SSLContext:
+        """Loading the CA certificates is expensive, so a context is shared
+        by all sessions with the same verification setting"""
+        context = create_default_context()
+        if not verify:
+            context.check_hostname = False
+            context.verify_mode = CERT_NONE
+        return context
+
+    @property
+    def client(self) -> ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                timeout=ClientTimeout(total=self.timeout),
+                auth=BasicAuth(
+                    self.auth.user, self.auth.password, encoding='utf-8'),
+                headers={'Content-Type': 'application/json-rpc'},
+                connector=TCPConnector(
+                    ssl=self.ssl, keepalive_timeout=self.keepalive_timeout,
+                    ttl_dns_cache=self.dns_cache_ttl))
+        return self._session
+
+    @asynccontextmanager
+    async def slot(self):
+        """Wait until both the PDU and the (shared) limit of all PDUs allow
+        another request. The PDU's own limit is acquired first, so that
+        queued requests do not hold on to a shared slot."""
+        async with self.limit:
+            async with self.shared:
+                yield
+
+    async def close(self) -> None:
+        """Close all connections to the PDU. The session can still be used
+        afterwards, in which case new connections are opened."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
 class Request:
-    def __init__(self, auth: RaritanAuth, id: Any = 0, collect_id: str = None):
+    def __init__(
+            self, auth: RaritanAuth, id: Any = 0, collect_id: str = None,
+            session: Optional[RaritanSession] = None,
+            body: Optional[bytes] = None, size: Optional[int] = None):
         self.auth = auth
         self.id = id
         self.requests = []
         self.collect_id = collect_id
+        self.session = session
+        self._body = body
+        self._size = size
+
+        # seconds the PDU took to respond, without waiting for a slot
+        self.duration: Optional[float] = None
 
     def __repr__(self):
         return str(self.json)
@@ -139,25 +316,70 @@ class Request:
             method='performBulk', params={'requests': self.requests},
             id=self.id)
 
-    async def send(self) -> Union[Responses, EmptyResponse]:
-        auth = self.auth
-        url = urljoin(auth.url, '/bulk')
-        ssl = None if auth.verify_ssl else False
+    @property
+    def body(self) -> bytes:
+        """Serialized request, either given on creation (e.g., cached from
+        an earlier request) or encoded from the added requests"""
+        if self._body is not None:
+            return self._body
+        return dumps(self.json)
 
-        async with ClientSession(
-                timeout=ClientTimeout(total=10),
-                auth=BasicAuth(auth.user, auth.password, encoding='utf-8'),
-                headers={'Content-Type': 'application/json-rpc'},
-                connector=TCPConnector(ssl=ssl)) as session:
-
-            try:
-                async with session.post(url, json=self.json) as response:
-                    return Responses(await response.json())
-            except SSLCertVerificationError as exc:
-                logger.error(f'(#{self.collect_id}) {exc}')
-            except HTTPException as exc:
-                logger.warning(f'(#{self.collect_id}) {exc}')
-            except ServerTimeoutError as exc:
-                logger.warning(f'(#{self.collect_id}) {exc}')
-
-            return EmptyResponse(exception=exc)  # noqa: F821
+    @property
+    def size(self) -> int:
+        """Number of requests in the bulk request, given on creation along
+        with a serialized `body`"""
+        if self._size is not None:
+            return self._size
+        return len(self.requests)
+
+    async def send(
+            self, parse: Callable[[dict], Any] = Responses
+    ) -> Union[Responses, EmptyResponse, Any]:
+        """Send the bulk request, the decoded JSON response is passed to
+        `parse`"""
+        with TRACER.span(
+                'request', collect_id=self.collect_id, pdu=self.auth.name,
+                requests=self.size):
+            return await self._send(parse)
+
+    async def _send(
+            self, parse: Callable[[dict], Any]
+    ) -> Union[Responses, EmptyResponse, Any]:
+        # without a long-lived session, a new one is used for this request
+        session = self.session or RaritanSession(self.auth)
+
+        try:
+            async with session.slot():
+                body = self.body
+                start = time.perf_counter()
+                async with session.client.post(
+                        session.url, data=body) as response:
+                    data = await response.read()
+
+                received = time.perf_counter()
+                self.duration = received - start
+                result = parse(loads(data))
+                if INSTRUMENTATION.enabled:
+                    INSTRUMENTATION.request(
+                        self.auth.name, duration=self.duration,
+                        decode=time.perf_counter() - received,
+                        sent=len(body), received=len(data))
+                TRACER.tag(
+                    sent=len(body), received=len(data),
+                    decode=f'{time.perf_counter() - received:.6f}')
+                return result
+        except SSLCertVerificationError as exc:
+            logger.error(f'(#{self.collect_id}) {exc}')
+            TRACER.tag(error=f'{type(exc).__name__}: {exc}')
+            return EmptyResponse(exception=exc)
+        except HTTPException as exc:
+            logger.warning(f'(#{self.collect_id}) {exc}')
+            TRACER.tag(error=f'{type(exc).__name__}: {exc}')
+            return EmptyResponse(exception=exc)
+        except (ServerTimeoutError, ServerDisconnectedError) as exc:
+            logger.warning(f'(#{self.collect_id}) {exc}')
+            TRACER.tag(error=f'{type(exc).__name__}: {exc}')
+            return EmptyResponse(exception=exc)
+        finally:
+            if self.session is None:
+                await session.close()
@@ -1,18 +1,45 @@
-from typing import List
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer
 import argparse
+import gzip
 import json
 import logging
+import signal
+import threading
 import time
 import urllib.parse
-from wsgiref.simple_server import make_server
 
 from prometheus_client import MetricsHandler, make_wsgi_app, REGISTRY
+from prometheus_client.core import Metric as PromMetric
+from prometheus_client.exposition import choose_encoder, gzip_accepted
 
-from . import DEFAULT_PORT
-from .exporter import RaritanExporter
+from . import DEFAULT_PORT, DEFAULT_WORKERS, LOG_FORMAT
+from .exporter import RaritanExporter, SCRAPE_DEADLINE, PRERENDERED
+from .exposition import Exposition
+from .instrumentation import INSTRUMENTATION
+from .profiling import PROFILER
+from .tracing import TRACER
+from .shards import ShardedExporter, select
 from .jsonrpc import RaritanAuth
 
 
+def sensor_interval(value: str) -> Tuple[str, float]:
+    """Parse a NAME=SECONDS read interval"""
+    name, _, interval = value.partition('=')
+    try:
+        name, interval = name.strip(), float(interval)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f'Expected NAME=SECONDS, got \'{value}\'')
+
+    if not name or not interval > 0:
+        raise argparse.ArgumentTypeError(
+            f'Expected a name and a positive number of seconds, got '
+            f'\'{value}\'')
+    return name, interval
+
+
 def parse_args():
     parser = argparse.ArgumentParser(
         description='Python-based Raritan PDU exporter for prometheus.io')
@@ -29,7 +56,155 @@ def parse_args():
         type=str, default=['WARNING', 'CRITICAL'],
         help='Specify logging level for internal and external logging, '
              'respectively (Default is WARNING,CRITICAL)')
-    return parser.parse_args()
+    parser.add_argument(
+        '-i', '--collect.interval', dest='poll_interval', required=False,
+        type=float, default=None,
+        help='Poll the PDUs in the background every given number of seconds '
+             'and serve the latest readings on scrape (default is to poll '
+             'the PDUs on every scrape)')
+    parser.add_argument(
+        '-t', '--collect.timeout', dest='timeout', required=False,
+        type=float, default=None,
+        help='Time budget in seconds for reading the PDUs when the scrape '
+             'does not specify a timeout (default is no time budget)')
+    parser.add_argument(
+        '--collect.timeout-offset', dest='timeout_offset', required=False,
+        type=float, default=0.5,
+        help='Seconds subtracted from the Prometheus scrape timeout to '
+             'account for network and rendering delays (default = 0.5)')
+    parser.add_argument(
+        '--collect.batch-size', dest='batch_size', required=False, type=int,
+        default=None,
+        help='Maximum number of sensor readings per request; larger PDUs are '
+             'read with multiple concurrent requests (default is a single '
+             'request per PDU)')
+    parser.add_argument(
+        '--collect.batch-latency', dest='batch_latency', required=False,
+        type=float, default=None,
+        help='Target duration in seconds of a single reading request, used '
+             'to tune the number of readings per request to the response '
+             'times of each PDU (default is no tuning)')
+    parser.add_argument(
+        '--collect.failure-threshold', dest='failure_threshold',
+        required=False, type=int, default=None,
+        help='Mark a PDU as down after the given number of consecutive '
+             'failed reads and skip reading it, except for retries with '
+             'exponential backoff (default is to read all PDUs on every '
+             'collection)')
+    parser.add_argument(
+        '--collect.sensor-interval', dest='intervals', metavar='NAME=SECONDS',
+        required=False, type=sensor_interval, action='append', default=[],
+        help='Read sensors of the given metric family (e.g., '
+             'raritanpdu_activeenergy_watthour_total) or sensor type (e.g., '
+             'temperature) at most every given number of seconds, serving '
+             'their latest reading in between; can be given multiple times '
+             '(default is to read all sensors on every collection)')
+    parser.add_argument(
+        '--collect.max-requests', dest='max_requests', required=False,
+        type=int, default=None,
+        help='Maximum number of requests to all PDUs at the same time; '
+             'with --collect.processes, per process (default is no limit)')
+    parser.add_argument(
+        '--collect.max-requests-per-pdu', dest='max_requests_per_pdu',
+        required=False, type=int, default=None,
+        help='Maximum number of requests to a single PDU at the same time '
+             '(default is no limit)')
+    parser.add_argument(
+        '--collect.coalesce-ttl', dest='coalesce_ttl', metavar='SECONDS',
+        required=False, type=float, default=0,
+        help='Serve the readings of a collection to scrapes arriving up to '
+             'this many seconds after it completed; concurrent scrapes '
+             'always share a single collection (default = 0)')
+    parser.add_argument(
+        '--collect.processes', dest='processes', required=False, type=int,
+        default=1,
+        help='Number of processes polling the PDUs, each polling a share of '
+             'the PDUs; requires --collect.interval (default = 1)')
+    parser.add_argument(
+        '--collect.self-metrics', dest='self_metrics', required=False,
+        action='store_true',
+        help='Export metrics about the exporter itself: request latency, '
+             'bytes and readings per PDU, durations of the collection '
+             'phases and event loop lag (default is off)')
+    parser.add_argument(
+        '--profile.directory', dest='profile_directory', required=False,
+        type=str, default=None,
+        help='Allow profiling collections on request (SIGUSR1 or POST '
+             '/profile), writing the profiles to this directory (default is '
+             'off)')
+    parser.add_argument(
+        '--profile.collections', dest='profile_collections', required=False,
+        type=int, default=5,
+        help='Number of collections profiled per request (default = 5)')
+    parser.add_argument(
+        '--profile.start', dest='profile_start', required=False,
+        action='store_true',
+        help='Profile the first collections after start-up (default is '
+             'off)')
+    parser.add_argument(
+        '--trace.file', dest='trace_file', metavar='PATH', required=False,
+        type=str, default=None,
+        help='Write traces of the collections, requests to the PDUs and '
+             'discoveries to this file (Zipkin JSON spans, one per line, '
+             'rotated at 10 MiB) (default is off)')
+    parser.add_argument(
+        '--trace.sample-rate', dest='trace_sample_rate', required=False,
+        type=float, default=1.,
+        help='Share of the collections that are traced (default = 1)')
+    parser.add_argument(
+        '--discovery.interval', dest='discovery_interval', required=False,
+        type=float, default=None,
+        help='Rediscover the connectors and sensors of the PDUs every given '
+             'number of seconds, and retry PDUs that failed discovery '
+             '(default is to discover PDUs only on start-up)')
+    parser.add_argument(
+        '--discovery.cache', dest='cache', metavar='PATH', required=False,
+        type=str, default=None,
+        help='Cache file for the discovered PDU topology; cached PDUs are '
+             'read immediately on start-up and rediscovered in the '
+             'background (default is no cache)')
+    parser.add_argument(
+        '--shard.count', dest='shard_count', required=False, type=int,
+        default=1,
+        help='Number of exporter replicas sharing the PDUs of the '
+             'configuration file; PDUs are assigned to replicas by a hash of '
+             'their name (default = 1)')
+    parser.add_argument(
+        '--shard.index', dest='shard_index', required=False, type=int,
+        default=0,
+        help='Replica (from 0 to --shard.count - 1) whose PDUs are '
+             'collected by this exporter (default = 0)')
+    parser.add_argument(
+        '--web.workers', dest='workers', required=False, type=int,
+        default=DEFAULT_WORKERS,
+        help=f'Maximum number of metric requests served concurrently '
+             f'(default = {DEFAULT_WORKERS})')
+    args = parser.parse_args()
+
+    if args.processes > 1 and not args.poll_interval:
+        parser.error('--collect.processes requires --collect.interval')
+
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error('--shard.index must be within [0, --shard.count)')
+    for option, value in (
+            ('--collect.batch-size', args.batch_size),
+            ('--collect.failure-threshold', args.failure_threshold),
+            ('--collect.max-requests', args.max_requests),
+            ('--collect.max-requests-per-pdu', args.max_requests_per_pdu)):
+        if value is not None and value < 1:
+            parser.error(f'{option} must be at least 1')
+    if args.profile_start and not args.profile_directory:
+        parser.error('--profile.start requires --profile.directory')
+    if not 1 <= args.profile_collections <= PROFILER.max_collections:
+        parser.error(
+            f'--profile.collections must be within '
+            f'[1, {PROFILER.max_collections}]')
+    if args.coalesce_ttl < 0:
+        parser.error('--collect.coalesce-ttl must not be negative')
+    if not 0 <= args.trace_sample_rate <= 1:
+        parser.error('--trace.sample-rate must be within [0, 1]')
+
+    return args
 
 
 def set_log_level(log_level: list) -> logging.Logger:
@@ -49,9 +224,7 @@ def set_log_level(log_level: list) -> logging.Logger:
 
     internal_log_level, external_log_level = log_level
     if external_log_level in level_names:
-        logging.basicConfig(
-            level=external_log_level,
-            format='[%(asctime)s] %(levelname)s: %(message)s')
+        logging.basicConfig(level=external_log_level, format=LOG_FORMAT)
     else:
         raise SystemExit(
             f'Unknown log-level: \'{external_log_level}\' try using '
@@ -91,7 +264,27 @@ def read_config(config: str) -> List[RaritanAuth]:
     return config_data
 
 
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """HTTP server handling every request in its own thread, so that health
+    checks are answered while metrics are being collected. The number of
+    concurrent metric requests is limited to `workers`."""
+    daemon_threads = True
+
+    def __init__(
+            self, *args, workers: int = DEFAULT_WORKERS,
+            timeout_offset: float = 0.5, **kwargs):
+        if workers < 1:
+            raise ValueError(f'At least 1 worker is required, got {workers}')
+
+        super().__init__(*args, **kwargs)
+        self.workers = threading.BoundedSemaphore(workers)
+        self.timeout_offset = timeout_offset
+
+
 class HealthcheckHandler(MetricsHandler):
+    # exporter whose pre-rendered exposition is served, if any
+    exporter: Optional[Union[RaritanExporter, ShardedExporter]] = None
+
     def do_GET(self):
         logging.debug(self.path)
         if self.path == '/healthcheck':
@@ -99,7 +292,114 @@ class HealthcheckHandler(MetricsHandler):
             self.end_headers()
             self.wfile.write(b'Server is running')
         else:
-            super().do_GET()
+            token = SCRAPE_DEADLINE.set(self.scrape_deadline())
+            try:
+                with self.server.workers:
+                    self.do_metrics()
+            finally:
+                SCRAPE_DEADLINE.reset(token)
+
+    def do_metrics(self):
+        """Serve the pre-rendered exposition of the latest snapshot when
+        available, otherwise collect all metrics"""
+        url = urllib.parse.urlparse(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        if url.path == '/probe':
+            return self.do_probe(params)
+
+        exposition = getattr(self.exporter, 'exposition', None)
+        if exposition is None or 'name[]' in params:
+            registry = self.registry
+            if 'name[]' in params:
+                registry = registry.restricted_registry(params['name[]'])
+            return self.send_families(registry.collect())
+
+        encoder, content_type = choose_encoder(self.headers.get('Accept'))
+        compress = gzip_accepted(self.headers.get('Accept-Encoding'))
+        token = PRERENDERED.set(True)
+        try:
+            output = exposition.output(
+                encoder, content_type, self.registry, compress=compress)
+        finally:
+            PRERENDERED.reset(token)
+
+        self.send_output(output, content_type, compress)
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != '/profile':
+            return self.send_error(404)
+        self.do_profile(urllib.parse.parse_qs(url.query))
+
+    def do_profile(self, params: Dict[str, List[str]]):
+        """Profile the next collections (`/profile?collections=<n>`)"""
+        if not PROFILER.available:
+            return self.send_error(404, 'Profiling is not enabled')
+        try:
+            collections = int(params.get('collections', [0])[0])
+        except ValueError:
+            return self.send_error(400, 'Invalid collections parameter')
+
+        try:
+            collections = PROFILER.request(max(collections, 0) or None)
+        except ValueError as exc:
+            return self.send_error(400, str(exc))
+        self.send_response(202)
+        self.send_header('Content-Type', 'text/plain')
+        self.end_headers()
+        self.wfile.write(
+            f'Profiling the next {collections} collections into '
+            f'{PROFILER.directory}\n'.encode())
+
+    def do_probe(self, params: Dict[str, List[str]]):
+        """Read a single PDU (`/probe?target=<pdu name>`) and serve only its
+        metrics"""
+        target = params.get('target', [None])[0]
+        if not hasattr(self.exporter, 'probe'):
+            return self.send_error(404, 'Probing is not available')
+        if target is None:
+            return self.send_error(400, 'Missing target parameter')
+
+        try:
+            families = self.exporter.probe(target)
+        except KeyError:
+            return self.send_error(400, f'Unknown target: {target}')
+
+        self.send_families(families)
+
+    def send_families(self, families: Iterable[PromMetric]):
+        """Render (and compress) the metric families in the requested
+        format. The families are collected before rendering starts, so that
+        only the rendering is timed."""
+        encoder, content_type = choose_encoder(self.headers.get('Accept'))
+        compress = gzip_accepted(self.headers.get('Accept-Encoding'))
+        exposition = Exposition(families)
+        start = time.perf_counter()
+        output = encoder(exposition)
+        if compress:
+            output = gzip.compress(output)
+        if INSTRUMENTATION.enabled:
+            INSTRUMENTATION.phase('render', time.perf_counter() - start)
+        self.send_output(output, content_type, compress)
+
+    def send_output(self, output: bytes, content_type: str, compress: bool):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if compress:
+            self.send_header('Content-Encoding', 'gzip')
+        self.end_headers()
+        self.wfile.write(output)
+
+    def scrape_deadline(self) -> Optional[float]:
+        """Deadline of the scrape, based on the scrape timeout Prometheus
+        sends with every request"""
+        timeout = self.headers.get('X-Prometheus-Scrape-Timeout-Seconds')
+        try:
+            timeout = float(timeout) - self.server.timeout_offset
+        except (TypeError, ValueError):
+            return None
+
+        return time.monotonic() + max(timeout, 0)
 
 
 def main():
@@ -112,27 +412,65 @@ def main():
     logger.info(f'Internal log level: {internal_log_level}')
     logger.info(f'External log level: {external_log_level}')
 
+    exporter = None
     try:
         # Read config
         logger.info(f'Loading configuration file \'{args.config}\'')
         config = read_config(args.config)
+        if args.shard_count > 1:
+            config = select(config, args.shard_index, args.shard_count)
+            logger.info(
+                f'Collecting {len(config)} PDUs in shard {args.shard_index} '
+                f'of {args.shard_count}')
+
+        if args.self_metrics:
+            INSTRUMENTATION.enable()
+
+        if args.profile_directory:
+            PROFILER.enable(
+                args.profile_directory, collections=args.profile_collections)
+            if hasattr(signal, 'SIGUSR1'):
+                signal.signal(
+                    signal.SIGUSR1, lambda signum, frame: PROFILER.request())
+            if args.profile_start:
+                PROFILER.request()
+
+        if args.trace_file:
+            TRACER.enable(args.trace_file, sample_rate=args.trace_sample_rate)
 
         # Set up http server
         listen_addr = urllib.parse.urlsplit(f'//{args.listen_address}')
         addr = listen_addr.hostname if listen_addr.hostname else '0.0.0.0'
         port = listen_addr.port if listen_addr.port else DEFAULT_PORT
         logger.info('listening on %s' % listen_addr.netloc)
-        REGISTRY.register(RaritanExporter(config=config))
+        options = dict(
+            timeout=args.timeout, batch_size=args.batch_size,
+            batch_latency=args.batch_latency,
+            discovery_interval=args.discovery_interval, cache=args.cache,
+            intervals=dict(args.intervals),
+            failure_threshold=args.failure_threshold,
+            max_requests=args.max_requests,
+            max_requests_per_pdu=args.max_requests_per_pdu,
+            coalesce_ttl=args.coalesce_ttl)
+        if args.processes > 1:
+            exporter = ShardedExporter(
+                config=config, processes=args.processes,
+                poll_interval=args.poll_interval, **options)
+        else:
+            exporter = RaritanExporter(
+                config=config, poll_interval=args.poll_interval, **options)
+        REGISTRY.register(exporter)
+        HealthcheckHandler.exporter = exporter
         prometheus_application = make_wsgi_app()
-        httpd = make_server(
-            addr,
-            port,
-            prometheus_application,
-            handler_class=HealthcheckHandler
-        )
+        httpd = ThreadingWSGIServer(
+            (addr, port), HealthcheckHandler, workers=args.workers,
+            timeout_offset=args.timeout_offset)
+        httpd.set_app(prometheus_application)
         httpd.serve_forever()
     except KeyboardInterrupt:
         logger.info('Interrupted by user')
+        if exporter is not None:
+            exporter.close()
         exit(0)
     except Exception as exc:
         logger.error(exc)
@@ -0,0 +1,141 @@
+from contextlib import contextmanager
+from typing import Optional
+import cProfile
+import os
+import pstats
+import threading
+import time
+
+from . import logger
+from .eventloop import EventLoopThread
+
+
+class Profiler:
+    """Profiles the next collections on request, e.g., to find out why
+    scrapes of a live exporter are slow
+
+    Profiling is requested for a number of collections and turns itself off
+    afterwards. Both the thread running the collection (e.g., building the
+    metric families) and the event loop thread (requests to the PDUs and
+    decoding of their responses) are profiled. The profile of every
+    collection is written to `directory` in the pstats format (`.prof`,
+    e.g., for `snakeviz`), along with the slowest calls and their callers
+    (`.txt`). While no profiling is requested, collections only check
+    `remaining`."""
+    # number of entries of the slowest calls and callers in the summary
+    top = 30
+
+    # most collections a single request may profile, as every profiled
+    # collection slows down the exporter and writes two files
+    max_collections = 100
+
+    def __init__(self) -> None:
+        self.directory = None
+        self.collections = 5
+        self.remaining = 0
+        self._active = False
+        self._lock = threading.Lock()
+
+    @property
+    def available(self) -> bool:
+        return self.directory is not None
+
+    def enable(self, directory: str, collections: int = 5) -> None:
+        """Allow profiling requests, writing the profiles to `directory`.
+        Each request profiles `collections` collections by default."""
+        if not 1 <= collections <= self.max_collections:
+            raise ValueError(
+                f'Between 1 and {self.max_collections} collections are '
+                f'required, got {collections}')
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.collections = collections
+
+    def request(self, collections: Optional[int] = None) -> int:
+        """Profile the next (number of) collections, returns how many.
+        Raises a ValueError for more than `max_collections` collections."""
+        if not self.available:
+            raise RuntimeError('Profiling is not enabled')
+        if collections is not None and collections > self.max_collections:
+            raise ValueError(
+                f'At most {self.max_collections} collections can be '
+                f'profiled, got {collections}')
+
+        with self._lock:
+            self.remaining = collections or self.collections
+        logger.info(
+            f'Profiling the next {self.remaining} collections into '
+            f'{self.directory}')
+        return self.remaining
+
+    def _start(self) -> bool:
+        """Whether to profile the collection that is about to start; only a
+        single collection is profiled at a time"""
+        with self._lock:
+            if self._active or self.remaining < 1:
+                return False
+            self.remaining -= 1
+            self._active = True
+            return True
+
+    @contextmanager
+    def collection(self, loop: EventLoopThread, collect_id: str = '-'):
+        """Profile the collection run in this context (and on `loop`), if
+        requested"""
+        if not self.remaining or not self._start():
+            yield
+            return
+
+        profile, loop_profile = cProfile.Profile(), cProfile.Profile()
+        loop.run(self._enable(loop_profile))
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            duration = time.perf_counter() - start
+            loop.run(self._disable(loop_profile))
+            try:
+                self.write(profile, loop_profile, collect_id, duration)
+            except OSError as exc:
+                logger.error(f'(#{collect_id}) Writing profile failed: {exc}')
+            finally:
+                with self._lock:
+                    self._active = False
+            if not self.remaining:
+                logger.info('Profiling finished')
+
+    @staticmethod
+    async def _enable(profile: cProfile.Profile) -> None:
+        profile.enable()
+
+    @staticmethod
+    async def _disable(profile: cProfile.Profile) -> None:
+        profile.disable()
+
+    def write(
+            self, profile: cProfile.Profile, loop_profile: cProfile.Profile,
+            collect_id: str, duration: float) -> str:
+        """Write the combined profile of a collection and its summary,
+        returns the path of the profile"""
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{collect_id}"
+        path = os.path.join(self.directory, f'{name}.prof')
+        stats = pstats.Stats(profile)
+        stats.add(loop_profile)
+        stats.dump_stats(path)
+
+        with open(os.path.join(self.directory, f'{name}.txt'), 'w') as file:
+            file.write(f'Collection {collect_id} took {duration:.3f}s\n\n')
+            stats.stream = file
+            stats.sort_stats('cumulative').print_stats(self.top)
+            stats.sort_stats('tottime').print_callers(self.top)
+
+        logger.info(
+            f'(#{collect_id}) Wrote profile of {duration:.3f}s collection to '
+            f'{path}')
+        return path
+
+
+PROFILER = Profiler()
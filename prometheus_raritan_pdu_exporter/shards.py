@@ -0,0 +1,216 @@
+from multiprocessing.connection import Connection
+from typing import Any, Dict, Iterable, List, Optional
+import copy
+import hashlib
+import logging
+import multiprocessing
+import threading
+
+from prometheus_client.core import GaugeMetricFamily, Metric as PromMetric
+
+from . import logger, EXPORTER_PREFIX, LOG_FORMAT
+from .exporter import RaritanExporter, PRERENDERED
+from .exposition import Exposition
+from .jsonrpc import RaritanAuth
+
+
+def shard_of(auth: RaritanAuth, count: int, salt: str = '') -> int:
+    """Shard a PDU belongs to. The assignment only depends on the name of
+    the PDU, so it does not change when other PDUs are added or removed.
+    Different salts give independent assignments, e.g., for splitting the
+    shard of an exporter replica across processes."""
+    digest = hashlib.sha1(f'{salt}{auth.name}'.encode()).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def split(
+        config: List[RaritanAuth], count: int, salt: str = ''
+) -> List[List[RaritanAuth]]:
+    """Split the PDUs into `count` shards"""
+    shards = [[] for _ in range(count)]
+    for auth in config:
+        shards[shard_of(auth, count, salt=salt)].append(auth)
+    return shards
+
+
+def select(
+        config: List[RaritanAuth], index: int, count: int
+) -> List[RaritanAuth]:
+    """PDUs in the shard `index` of `count` shards (e.g., exporter
+    replicas)"""
+    if not 0 <= index < count:
+        raise ValueError(f'Shard index {index} is not within [0, {count})')
+    return split(config, count)[index]
+
+
+def merge(shards: Iterable[List[PromMetric]]) -> List[PromMetric]:
+    """Merge the metric families of several shards, combining the samples
+    of families with the same name"""
+    merged = {}
+    for families in shards:
+        for family in families:
+            if family.name in merged:
+                merged[family.name].samples.extend(family.samples)
+            else:
+                merged[family.name] = copy.copy(family)
+                merged[family.name].samples = list(family.samples)
+    return list(merged.values())
+
+
+def down(config: List[RaritanAuth]) -> List[PromMetric]:
+    """Metric families reporting the PDUs as down, e.g., of a shard that has
+    nothing (or no longer anything) to serve"""
+    g = GaugeMetricFamily(
+        f'{EXPORTER_PREFIX}_up', 'Whether the PDU could be read',
+        labels=['pdu'])
+    for auth in config:
+        g.add_metric([auth.name], 0)
+    return [g]
+
+
+def poll_shard(
+        config: List[RaritanAuth], conn: Connection, interval: float,
+        log_levels: Optional[tuple] = None, **kwargs: Any) -> None:
+    """Worker process polling a shard of the PDUs every `interval` seconds
+    and sending the metric families to the parent process, until the parent
+    sends anything or closes the connection"""
+    if log_levels is not None:
+        internal_log_level, external_log_level = log_levels
+        logging.basicConfig(level=external_log_level, format=LOG_FORMAT)
+        logger.setLevel(internal_log_level)
+
+    kwargs['timeout'] = kwargs.get('timeout') or interval
+    exporter = RaritanExporter(config=config, **kwargs)
+    sent = False
+    try:
+        while True:
+            try:
+                exporter.poll()
+                conn.send(exporter.exposition.families)
+                sent = True
+            except (EOFError, OSError):
+                raise
+            except Exception as exc:
+                logger.error(f'Background poll failed: {exc}')
+                if not sent:
+                    # the parent process waits for a first poll
+                    conn.send(down(config))
+                    sent = True
+
+            if conn.poll(interval):
+                break
+    except (EOFError, OSError):
+        pass
+    finally:
+        exporter.close()
+        conn.close()
+
+
+class ShardedExporter:
+    """Polls the PDUs from several worker processes, each with its own event
+    loop and PDU sessions, and serves the merged metric families of their
+    latest polls
+
+    Decoding the responses and building the metric families of a few hundred
+    PDUs saturates a single core, which is spread across all cores this
+    way. Like `RaritanExporter`, the merged families are served as a
+    pre-rendered exposition. Each worker process keeps its own topology
+    cache (the given path suffixed with its shard), so that they do not
+    overwrite each other's topologies."""
+    # processes are spawned, as forking a process with running threads
+    # (e.g., the HTTP server) is unsafe
+    context = multiprocessing.get_context('spawn')
+
+    # seconds to wait for a worker process to stop before terminating it
+    stop_timeout = 10
+
+    # independent of the assignment of PDUs to exporter replicas
+    salt = 'process:'
+
+    def __init__(
+            self, config: List[RaritanAuth], processes: int,
+            poll_interval: float, **kwargs: Any) -> None:
+        if processes < 2:
+            raise ValueError(
+                f'At least 2 processes are required, got {processes}')
+        if not poll_interval:
+            raise ValueError('Polling multiple processes requires an interval')
+
+        self.exposition = None
+        self._families: Dict[int, List[PromMetric]] = {}
+        self._lock = threading.Lock()
+        self._workers = []
+
+        log_levels = (logger.level, logging.root.level)
+        shards = split(config, processes, salt=self.salt)
+        for shard, pdus in enumerate(shards):
+            if not pdus:
+                continue
+
+            options = dict(kwargs)
+            if options.get('cache'):
+                options['cache'] = f'{options["cache"]}.{shard}'
+            conn, child_conn = self.context.Pipe()
+            process = self.context.Process(
+                target=poll_shard, name=f'raritan-shard-{shard}',
+                args=(pdus, child_conn, poll_interval, log_levels),
+                kwargs=options, daemon=True)
+            process.start()
+            ready = threading.Event()
+            receiver = threading.Thread(
+                target=self._receive, args=(shard, pdus, conn, ready),
+                name=f'raritan-shard-{shard}-receiver', daemon=True)
+            receiver.start()
+            self._workers.append((process, conn, receiver, ready))
+            logger.info(f'Polling {len(pdus)} PDUs in shard {shard}')
+
+        # make sure the first scrape has data to serve
+        for _, _, _, ready in self._workers:
+            ready.wait()
+
+    def _receive(
+            self, shard: int, config: List[RaritanAuth], conn: Connection,
+            ready: threading.Event) -> None:
+        """Merge the families of every poll of a shard into the exposition.
+        Once the worker process stops, its PDUs are reported as down."""
+        while True:
+            try:
+                families = conn.recv()
+            except (EOFError, OSError):
+                break
+
+            self._update(shard, families)
+            ready.set()
+
+        if self._workers is not None:
+            logger.error(f'Shard {shard} stopped polling')
+            self._update(shard, down(config))
+        ready.set()
+
+    def _update(self, shard: int, families: List[PromMetric]) -> None:
+        with self._lock:
+            self._families[shard] = families
+            self.exposition = Exposition(merge(
+                self._families[s] for s in sorted(self._families)))
+
+    def collect(self):
+        if PRERENDERED.get() or self.exposition is None:
+            return
+        yield from self.exposition.families
+
+    def close(self) -> None:
+        """Stop all worker processes"""
+        workers, self._workers = self._workers, None
+        for process, conn, receiver, _ in workers:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+
+        for process, conn, receiver, _ in workers:
+            process.join(self.stop_timeout)
+            if process.is_alive():
+                process.terminate()
+            receiver.join()
+            conn.close()
+        self.exposition = None
@@ -0,0 +1,182 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import json
+import logging
+import random
+import threading
+import time
+
+from . import logger, EXPORTER_PREFIX
+
+
+def new_id(bits: int = 64) -> str:
+    """Random hex identifier of a trace (128 bits) or span (64 bits)"""
+    return f'{random.getrandbits(bits):0{bits // 4}x}'
+
+
+@dataclass
+class Span:
+    """Timed operation of a trace, e.g., a collection, a request to a PDU or
+    a processing phase"""
+    name: str
+    trace_id: str
+    parent_id: Optional[str] = None
+    id: str = field(default_factory=new_id)
+    timestamp: float = field(default_factory=time.time)
+    tags: Dict[str, str] = field(default_factory=dict)
+    start: float = field(default_factory=time.perf_counter, repr=False)
+
+    def tag(self, **tags: Any) -> None:
+        # tag values are strings in the Zipkin format
+        self.tags.update((key, str(value)) for key, value in tags.items())
+
+    def json(self, duration: float, service: str) -> Dict[str, Any]:
+        """Zipkin v2 representation of the finished span"""
+        span = {
+            'traceId': self.trace_id, 'id': self.id, 'name': self.name,
+            'timestamp': int(self.timestamp * 1e6),
+            'duration': max(int(duration * 1e6), 1),
+            'localEndpoint': {'serviceName': service}, 'tags': self.tags}
+        if self.parent_id is not None:
+            span['parentId'] = self.parent_id
+        return span
+
+
+# Span of the operation running in the current context. Tasks on the event
+# loop inherit it from the task that created them.
+CURRENT_SPAN: ContextVar[Optional[Span]] = ContextVar(
+    'current_span', default=None)
+
+
+class Tracer:
+    """Traces of collections (and discoveries), written as Zipkin v2 spans
+    (one JSON object per line) to a rotating file
+
+    Only a `sample_rate` share of the traces is recorded. Spans find their
+    parent in the current context; as collections hand over to the event
+    loop thread, spans there can also find the root span of a trace by its
+    collection id. While disabled (or outside of a sampled trace), starting
+    a span only checks the current context."""
+    # bytes a trace file grows to before it is rotated, and the number of
+    # rotated files that are kept
+    max_bytes = 10 * 2 ** 20
+    backup_count = 5
+
+    # number of missing response ids tagged on a span at most
+    max_ids = 100
+
+    service = EXPORTER_PREFIX
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.sample_rate = 1.
+        self._traces: Dict[str, Span] = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(f'{logger.name}.traces')
+        self.logger.propagate = False
+
+    def enable(self, path: str, sample_rate: float = 1.) -> None:
+        """Start writing the sampled traces to `path`"""
+        if not 0 <= sample_rate <= 1:
+            raise ValueError(
+                f'Sample rate must be within [0, 1], got {sample_rate}')
+
+        handler = RotatingFileHandler(
+            path, maxBytes=self.max_bytes, backupCount=self.backup_count,
+            delay=True)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger.addHandler(handler)
+        self.logger.setLevel(logging.INFO)
+        self.sample_rate = sample_rate
+        self.enabled = True
+
+    @contextmanager
+    def trace(self, name: str, collect_id: Optional[str] = None, **tags):
+        """Root span of a new trace, if it is sampled"""
+        if not self.enabled or random.random() >= self.sample_rate:
+            yield None
+            return
+
+        span = Span(name=name, trace_id=new_id(128))
+        span.tag(**tags)
+        if collect_id is not None:
+            span.tag(collect_id=collect_id)
+            with self._lock:
+                self._traces[collect_id] = span
+        try:
+            with self._current(span):
+                yield span
+        finally:
+            if collect_id is not None:
+                with self._lock:
+                    self._traces.pop(collect_id, None)
+
+    @contextmanager
+    def span(self, name: str, collect_id: Optional[str] = None, **tags):
+        """Child span of the current span, or of the root span of the
+        collection, if the trace is sampled"""
+        parent = CURRENT_SPAN.get()
+        if parent is None and collect_id is not None and self._traces:
+            parent = self._traces.get(collect_id)
+        if parent is None:
+            yield None
+            return
+
+        span = Span(name=name, trace_id=parent.trace_id, parent_id=parent.id)
+        span.tag(**tags)
+        with self._current(span):
+            yield span
+
+    @contextmanager
+    def _current(self, span: Span):
+        token = CURRENT_SPAN.set(span)
+        try:
+            yield
+        except BaseException as exc:
+            # including cancelled reads of PDUs that missed the deadline
+            error = type(exc).__name__
+            span.tag(error=f'{error}: {exc}' if str(exc) else error)
+            raise
+        finally:
+            CURRENT_SPAN.reset(token)
+            self.finish(span)
+
+    def finish(self, span: Span) -> None:
+        duration = time.perf_counter() - span.start
+        self.logger.info(json.dumps(span.json(duration, self.service)))
+
+    @staticmethod
+    def tag(**tags: Any) -> None:
+        """Tag the current span, if any"""
+        span = CURRENT_SPAN.get()
+        if span is not None:
+            span.tag(**tags)
+
+    def missing(
+            self, kind: str, requested: Iterable, returned: Iterable,
+            source: str = '-', collect_id: str = '-',
+            name: Optional[Callable[[Any], Any]] = None) -> List:
+        """Ids of the requests without a response, tagged on the current
+        span as `missing.<kind>` (and logged at debug level). Missing ids
+        are reported by their `name`, e.g., the resource of a sensor."""
+        span = CURRENT_SPAN.get()
+        if span is None and not logger.isEnabledFor(logging.DEBUG):
+            return []
+
+        returned = set(returned)
+        missing = [id for id in requested if id not in returned]
+        if missing:
+            names = [str(id if name is None else name(id)) for id in missing]
+            if span is not None:
+                span.tags[f'missing.{kind}'] = ','.join(names[:self.max_ids])
+                span.tags[f'missing.{kind}.count'] = str(len(missing))
+            logger.debug(
+                f"({source}#{collect_id}) No {kind} response for "
+                f"{', '.join(names)}")
+        return missing
+
+
+TRACER = Tracer()
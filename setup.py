@@ -32,6 +32,8 @@ setup(
     install_requires=[
         "prometheus_client~=0.14.0",
         "aiohttp~=3.8.0"],
+    extras_require={
+        "orjson": ["orjson"]},
     project_urls={
         "Bug Reports":
             "https://github.com/psyinfra/prometheus-raritan-pdu-exporter/issues",  # noqa: E501
@@ -0,0 +1,42 @@
+"""Tests for benchmarks/micro.py and benchmarks/results.py"""
+from benchmarks import micro, results
+from benchmarks.mockpdu import MockPDU, Topology
+
+
+def test_micro():
+    topology = Topology(outlets=2)
+    pdus, readings, bodies = micro.payloads(MockPDU(topology=topology), 2)
+    assert [pdu.n_sensors for pdu in pdus] == [topology.n_sensors] * 2
+    assert set(bodies) >= {'details', 'readings'}
+
+    functions, exporter = micro.benchmarks(pdus, readings, bodies)
+    records = [
+        micro.measure(name, function, n, repeat=2)
+        for name, (function, n) in functions.items()]
+    exporter.close()
+    assert [r['name'] for r in records] == [
+        f'micro/{name}' for name in functions]
+    assert all(0 < r['min'] <= r['median'] for r in records)
+
+
+def test_results(tmp_path, capsys):
+    assert results.percentile([3, 1, 2, 4], 50) == 2
+    assert results.percentile([3, 1, 2, 4], 99) == 4
+    assert results.percentile([3, 1, 2, 4], 0) == 1
+
+    path = str(tmp_path / 'results.jsonl')
+    results.save(path, [{'name': 'a', 'time': 1.0}, {'name': 'b', 'time': 1}])
+    results.save(path, [{'name': 'a', 'time': 2.0}])
+    baseline = results.load(path)
+    assert baseline['a']['time'] == 2.0
+    assert 'commit' in baseline['a']['env']
+
+    assert results.compare(baseline, [{'name': 'a', 'time': 2.1}], ['time'])
+    assert not results.compare(
+        baseline, [{'name': 'b', 'time': 2}, {'name': 'c', 'time': 1}],
+        ['time'])
+    output = capsys.readouterr().out
+    assert 'REGRESSION' in output and 'c: not in baseline' in output
+
+    results.save(None, [{'name': 'a', 'time': 1.0}])
+    assert '"name": "a"' in capsys.readouterr().out
@@ -0,0 +1,73 @@
+"""Tests for prometheus_raritan_pdu_exporter/cache.py"""
+import json
+
+import vcr
+
+from prometheus_raritan_pdu_exporter.cache import TopologyCache
+from prometheus_raritan_pdu_exporter.exporter import RaritanExporter
+from prometheus_raritan_pdu_exporter.interfaces import PDU
+from prometheus_raritan_pdu_exporter.jsonrpc import (
+    RaritanAuth, Request, EmptyResponse)
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_topology_cache(raritan_auth, tmp_path, monkeypatch):
+    path = tmp_path / 'topology.json'
+    exporter = RaritanExporter(config=raritan_auth, cache=str(path))
+    exporter.close()
+
+    with open(path) as json_file:
+        topologies = json.load(json_file)
+    assert set(topologies) == {pdu.name for pdu in exporter.pdus}
+
+    # PDUs are restored from cache, even when they cannot be reached
+    async def mock_send(self):
+        return EmptyResponse(exception=ConnectionError('mocked error'))
+
+    monkeypatch.setattr(Request, 'send', mock_send)
+    cached = RaritanExporter(config=raritan_auth, cache=str(path))
+    assert len(cached.pdus) == len(exporter.pdus)
+    for pdu, original in zip(cached.pdus, exporter.pdus):
+        assert pdu.name == original.name
+        assert pdu.n_sensors == original.n_sensors
+        assert [s.name for s in pdu.sensors] == [
+            s.name for s in original.sensors]
+        assert [s.parent.name for s in pdu.sensors] == [
+            s.parent.name for s in original.sensors]
+        assert all(c.pdu is pdu for c in pdu.connectors)
+    cached.close()
+
+
+def test_topology_cache_invalid(raritan_auth, tmp_path):
+    path = tmp_path / 'topology.json'
+    path.write_text('{"invalid json')
+    assert TopologyCache(str(path)).topologies == {}
+
+    # cached topology of a PDU at a different address is ignored
+    path.write_text(json.dumps({raritan_auth[0].name: {
+        'url': 'https://elsewhere', 'connectors': [], 'poles': [],
+        'sensors': []}}))
+    cache = TopologyCache(str(path))
+    assert not cache.load(PDU(auth=raritan_auth[0]))
+    assert not cache.load(PDU(auth=raritan_auth[1]))
+
+    # failing writes leave the cache file untouched
+    cache.path = str(tmp_path / 'missing' / 'topology.json')
+    cache.save({})
+    assert not (tmp_path / 'missing').exists()
+
+
+def test_topology_cache_write_failure(tmp_path, monkeypatch):
+    def mock_dump(*args, **kwargs):
+        raise OSError('mocked error')
+
+    auth = RaritanAuth(
+        name='foo', url='https://127.0.0.1:9840', user='admin', password='xxx')
+    cache = TopologyCache(str(tmp_path / 'topology.json'))
+    assert cache.update([PDU(auth=auth)])['foo']['url'] == auth.url
+
+    monkeypatch.setattr(json, 'dump', mock_dump)
+    cache.save(cache.topologies)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,52 @@
+"""Tests for prometheus_raritan_pdu_exporter/coalescing.py"""
+import threading
+
+import pytest
+
+from prometheus_raritan_pdu_exporter.coalescing import (
+    FlightTimeout, SingleFlight)
+
+
+def test_single_flight():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def read():
+        calls.append(len(calls))
+        started.set()
+        release.wait()
+        return calls[-1]
+
+    results = []
+    leader = threading.Thread(
+        target=lambda: results.append(flight.run(read, id='leader')))
+    leader.start()
+    started.wait()
+
+    # callers arriving during the call share its result
+    follower = threading.Thread(
+        target=lambda: results.append(flight.run(read, id='follower')))
+    follower.start()
+    with pytest.raises(FlightTimeout):
+        flight.run(read, id='impatient', timeout=0.01)
+    release.set()
+    leader.join()
+    follower.join()
+    assert results == [(0, 'leader'), (0, 'leader')]
+    assert calls == [0]
+
+    # without a TTL, completed calls are not shared
+    assert flight.run(read, id='next') == (1, 'next')
+    flight.ttl = 3600
+    assert flight.run(read, id='fresh') == (1, 'next')
+
+    # failed calls are not shared either
+    flight = SingleFlight(ttl=3600)
+
+    def fail():
+        raise ValueError('failed')
+
+    with pytest.raises(ValueError):
+        flight.run(fail)
+    assert flight.run(read, id='retry') == (2, 'retry')
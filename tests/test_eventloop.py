@@ -0,0 +1,29 @@
+"""Tests for prometheus_raritan_pdu_exporter/eventloop.py"""
+import asyncio
+import threading
+
+from prometheus_raritan_pdu_exporter.eventloop import EventLoopThread
+
+
+def test_event_loop_thread():
+    loop = EventLoopThread()
+    assert loop.is_running
+
+    async def loop_thread():
+        return asyncio.get_running_loop(), threading.current_thread()
+
+    running_loop, thread = loop.run(loop_thread())
+    assert running_loop is loop.loop
+    assert thread is not threading.current_thread()
+
+    # coroutines share the same loop across calls
+    assert loop.run(loop_thread())[0] is running_loop
+
+    # pending tasks are cancelled on stop
+    pending = loop.submit(asyncio.sleep(3600))
+    loop.stop()
+    assert pending.cancelled()
+    assert not loop.is_running
+    assert loop.loop.is_closed()
+
+    loop.stop()  # stopping twice is harmless
@@ -1,9 +1,16 @@
 """Tests for prometheus_raritan_pdu_exporter/exporter.py"""
+import asyncio
+import time
+
+import pytest
 import vcr
 
 from prometheus_raritan_pdu_exporter import EXPORTER_PREFIX
-from prometheus_raritan_pdu_exporter.exporter import RaritanExporter
-from prometheus_raritan_pdu_exporter.interfaces import Metric, MetricFamily
+from prometheus_raritan_pdu_exporter.exporter import (
+    RaritanExporter, SCRAPE_DEADLINE, PRERENDERED)
+from prometheus_raritan_pdu_exporter.interfaces import (
+    PDU, Metric, MetricFamily)
+from prometheus_raritan_pdu_exporter.jsonrpc import RaritanAuth
 from prometheus_client.core import Metric as PromMetric
 
 
@@ -41,6 +48,8 @@ def test_raritan_exporter_init(raritan_auth):
         # number of used sensors is variable depending on PDU setup
         assert len(pdu.sensors) == pdu.n_sensors > 0
 
+    exporter.close()
+
 
 @vcr.use_cassette(
     'tests/fixtures/vcr_cassettes/data.yaml',
@@ -69,6 +78,8 @@ def test_raritan_exporter_read(raritan_auth):
             if metric.is_numeric:
                 assert isinstance(metric.value, (float, int))
 
+    exporter.close()
+
 
 @vcr.use_cassette(
     'tests/fixtures/vcr_cassettes/data.yaml',
@@ -87,3 +98,199 @@ def test_raritan_exporter_collect(raritan_auth):
         for sample in metric.samples:
             assert sample.labels['pdu'] in pdu_names
             assert isinstance(sample.value, (int, float))
+
+    exporter.close()
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_raritan_exporter_poll(raritan_auth, monkeypatch):
+    exporter = RaritanExporter(config=raritan_auth, poll_interval=3600)
+    assert len(exporter.snapshot) > 0
+
+    # scrapes are served from the snapshot without reading from the PDUs
+    monkeypatch.setattr(exporter, 'read', None)
+    results = list(exporter.collect())
+    families = {
+        family.name for readings in exporter.snapshot
+        for family in readings.families}
+    assert len(results) == len(families) + 2  # + deadline_exceeded, up
+    assert len(exporter.exposition.families) == len(results)
+
+    # readings served from the pre-rendered exposition are not collected
+    token = PRERENDERED.set(True)
+    assert list(exporter.collect()) == []
+    PRERENDERED.reset(token)
+    exporter.close()
+    assert exporter._poller is None
+    assert not exporter.loop.is_running
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_raritan_exporter_deadline(raritan_auth, monkeypatch):
+    exporter = RaritanExporter(config=raritan_auth, timeout=30)
+    assert exporter.deadline() == 30
+
+    async def stuck_read(collect_id='-'):
+        await asyncio.sleep(3600)
+
+    stuck = exporter.pdus[0]
+    monkeypatch.setattr(stuck, 'read_values', stuck_read)
+
+    # the scrape timeout sent by Prometheus takes precedence
+    SCRAPE_DEADLINE.set(time.monotonic() + 0.5)
+    assert exporter.deadline() <= 0.5
+
+    start = time.monotonic()
+    results = {metric.name: metric for metric in exporter.collect()}
+    assert time.monotonic() - start < 5
+
+    # partial results from the PDUs that answered in time
+    pdus = {
+        sample.labels['pdu'] for name, metric in results.items()
+        for sample in metric.samples if name not in (
+            f'{EXPORTER_PREFIX}_deadline_exceeded', f'{EXPORTER_PREFIX}_up')}
+    assert stuck.name not in pdus
+    assert len(pdus) == len(exporter.pdus) - 1
+
+    missed = {
+        sample.labels['pdu']: sample.value for sample in
+        results[f'{EXPORTER_PREFIX}_deadline_exceeded'].samples}
+    assert missed.pop(stuck.name) == 1
+    assert set(missed.values()) == {0}
+
+    up = {
+        sample.labels['pdu']: sample.value for sample in
+        results[f'{EXPORTER_PREFIX}_up'].samples}
+    assert up.pop(stuck.name) == 0
+    assert set(up.values()) == {1}
+    assert stuck.breaker.failures == 1
+
+    SCRAPE_DEADLINE.set(None)
+    exporter.close()
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_raritan_exporter_coalesce(raritan_auth, monkeypatch):
+    exporter = RaritanExporter(config=raritan_auth, coalesce_ttl=3600)
+    reads = []
+    read_values = exporter._read_values
+
+    def counted_read(**kwargs):
+        reads.append(kwargs['collect_id'])
+        return read_values(**kwargs)
+
+    monkeypatch.setattr(exporter, '_read_values', counted_read)
+
+    # a scrape right after another shares its readings
+    first = [metric.samples for metric in exporter.collect()]
+    second = [metric.samples for metric in exporter.collect()]
+    assert len(reads) == 1
+    assert first == second
+    exporter.close()
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_raritan_exporter_intervals(raritan_auth, caplog):
+    exporter = RaritanExporter(
+        config=raritan_auth, intervals={'voltage': 60, 'temprature': 60})
+    exporter.close()
+
+    # intervals of names without any sensor are most likely typos
+    warnings = [
+        r.getMessage() for r in caplog.records if 'sensor interval' in
+        r.getMessage()]
+    assert len(warnings) == 1 and 'temprature' in warnings[0]
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_raritan_exporter_retry(raritan_auth):
+    exporter = RaritanExporter(config=raritan_auth, discovery_interval=3600)
+    exporter.retry_delay = 0
+    topology = [
+        exporter.pdus[0].connectors, exporter.pdus[0].poles,
+        exporter.pdus[0].sensors]
+    pdu = PDU(auth=raritan_auth[0])
+    exporter.failed.append(pdu)
+    attempts = []
+
+    async def mock_setup():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise ConnectionError('mocked error')
+        if len(attempts) == 3:
+            pdu.update(*topology)
+
+    pdu.setup = mock_setup
+    exporter.loop.run(exporter._retry(pdu), timeout=10)
+    assert len(attempts) == 3
+    assert exporter.pdus[-1] is pdu
+    assert pdu not in exporter.failed
+    exporter.close()
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_raritan_exporter_rediscover(raritan_auth):
+    exporter = RaritanExporter(config=raritan_auth)
+    exporter.discovery_interval = 0
+    attempts = []
+
+    class Stop(BaseException):
+        pass
+
+    async def mock_verify(pdus):
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise KeyError('mocked error')
+        if len(attempts) == 2:
+            raise Stop()
+
+    # a failed rediscovery does not stop the periodic rediscovery
+    exporter._verify = mock_verify
+    with pytest.raises(Stop):
+        exporter.loop.run(exporter._rediscover(), timeout=10)
+    assert len(attempts) == 2
+    exporter.close()
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_raritan_exporter_probe(raritan_auth):
+    exporter = RaritanExporter(
+        config=raritan_auth, max_requests=2, max_requests_per_pdu=1)
+    assert exporter.pdus[0].session.shared is exporter.limit
+    assert exporter.pdus[0].session.limit.limit == 1
+    target = exporter.pdus[0]
+    results = {metric.name: metric for metric in exporter.probe(target.name)}
+
+    # only the metrics of the probed PDU are returned
+    assert len(results) > 2
+    assert {
+        sample.labels['pdu'] for metric in results.values()
+        for sample in metric.samples} == {target.name}
+    assert results[f'{EXPORTER_PREFIX}_up'].samples[0].value == 1
+
+    # PDUs that failed discovery are down
+    failed = PDU(auth=RaritanAuth(
+        name='failed', url='https://127.0.0.1', user='admin', password='x'))
+    exporter.failed.append(failed)
+    results = {metric.name: metric for metric in exporter.probe(failed.name)}
+    assert set(results) == {
+        f'{EXPORTER_PREFIX}_up', f'{EXPORTER_PREFIX}_deadline_exceeded'}
+    assert results[f'{EXPORTER_PREFIX}_up'].samples[0].value == 0
+
+    with pytest.raises(KeyError):
+        exporter.probe('unknown')
+    exporter.close()
@@ -32,7 +32,7 @@ def test_empty_response_connector_rids(
 @vcr.use_cassette(
     'tests/fixtures/vcr_cassettes/data.yaml',
     filter_headers=['authorization'])
-def test_empty_response_connector_metadata(
+def test_empty_response_connector_details(
         raritan_auth, test_exception, monkeypatch):
     """EmptyResponse returned during any of the setup steps"""
     async def mock_send(self):
@@ -44,32 +44,21 @@ def test_empty_response_connector_metadata(
     monkeypatch.setattr(Request, 'send', mock_send)
 
     with pytest.raises(test_exception):
-        _ = asyncio.run(pdu._connector_metadata(connectors))
+        _ = asyncio.run(pdu._connector_details(connectors))
 
 
-@vcr.use_cassette(
-    'tests/fixtures/vcr_cassettes/data.yaml',
-    filter_headers=['authorization'])
-def test_empty_response_connector_settings(
-        raritan_auth, test_exception, monkeypatch):
-    """EmptyResponse returned during any of the setup steps"""
-    async def mock_send(self):
-        response = EmptyResponse(exception=test_exception())
-        return response
-
+def test_connector_details_without_connectors(raritan_auth):
+    """Sensors cannot be discovered without connectors"""
     pdu = PDU(auth=raritan_auth[0])
-    connectors = asyncio.run(pdu._connector_rids())
-    connectors = asyncio.run(pdu._connector_metadata(connectors))
-    monkeypatch.setattr(Request, 'send', mock_send)
 
-    with pytest.raises(test_exception):
-        _ = asyncio.run(pdu._connector_settings(connectors))
+    with pytest.raises(ValueError):
+        _ = asyncio.run(pdu._connector_details([]))
 
 
 @vcr.use_cassette(
     'tests/fixtures/vcr_cassettes/data.yaml',
     filter_headers=['authorization'])
-def test_empty_response_sensors_from_poles(
+def test_empty_response_sensor_metadata(
         raritan_auth, test_exception, monkeypatch):
     """EmptyResponse returned during any of the setup steps"""
     async def mock_send(self):
@@ -77,41 +66,37 @@ def test_empty_response_sensors_from_poles(
         return response
 
     pdu = PDU(auth=raritan_auth[0])
+    connectors = asyncio.run(pdu._connector_rids())
+    _, _, sensors = asyncio.run(pdu._connector_details(connectors))
     monkeypatch.setattr(Request, 'send', mock_send)
 
     with pytest.raises(test_exception):
-        _ = asyncio.run(pdu._sensors_from_poles())
+        _ = asyncio.run(pdu._sensor_metadata(sensors))
 
 
 @vcr.use_cassette(
     'tests/fixtures/vcr_cassettes/data.yaml',
     filter_headers=['authorization'])
-def test_empty_response_sensors_from_connectors(
-        raritan_auth, test_exception, monkeypatch):
-    """EmptyResponse returned during any of the setup steps"""
+def test_empty_response_read(raritan_auth, test_exception, monkeypatch):
+    """EmptyResponse returned when reading from sensors"""
     async def mock_send(self):
         response = EmptyResponse(exception=test_exception())
         return response
 
     pdu = PDU(auth=raritan_auth[0])
-    asyncio.run(pdu._connectors())
+    asyncio.run(pdu.setup())
     monkeypatch.setattr(Request, 'send', mock_send)
-
-    with pytest.raises(test_exception):
-        _ = asyncio.run(pdu._sensors_from_connectors(pdu.connectors))
+    metrics = asyncio.run(pdu.read())
+    assert len(metrics) == 0
 
 
-@vcr.use_cassette(
-    'tests/fixtures/vcr_cassettes/data.yaml',
-    filter_headers=['authorization'])
-def test_empty_response_read(raritan_auth, test_exception, monkeypatch):
-    """EmptyResponse returned when reading from sensors"""
+def test_empty_response_setup(raritan_auth, test_exception, monkeypatch):
+    """PDUs failing any of the setup steps are not discovered"""
     async def mock_send(self):
         response = EmptyResponse(exception=test_exception())
         return response
 
     pdu = PDU(auth=raritan_auth[0])
-    asyncio.run(pdu.setup())
     monkeypatch.setattr(Request, 'send', mock_send)
-    metrics = asyncio.run(pdu.read())
-    assert len(metrics) == 0
+    asyncio.run(pdu.setup())
+    assert not pdu.is_discovered
@@ -0,0 +1,77 @@
+"""Tests for prometheus_raritan_pdu_exporter/instrumentation.py"""
+import asyncio
+
+import vcr
+from prometheus_client import CollectorRegistry
+
+from prometheus_raritan_pdu_exporter.exporter import RaritanExporter
+from prometheus_raritan_pdu_exporter.instrumentation import (
+    INSTRUMENTATION, Instrumentation)
+
+
+def sample(registry, name, **labels):
+    return registry.get_sample_value(name, labels) or 0
+
+
+def test_instrumentation_enable():
+    instrumentation = Instrumentation()
+    registry = CollectorRegistry()
+    assert not instrumentation.enabled
+
+    instrumentation.enable(registry=registry)
+    instrumentation.enable(registry=registry)  # registered only once
+    assert instrumentation.enabled
+    instrumentation.phase('render', 0.5)
+    assert sample(
+        registry, 'raritanpdu_exporter_phase_duration_seconds_sum',
+        phase='render') == 0.5
+
+
+def test_instrumentation_event_loop_lag():
+    instrumentation = Instrumentation()
+    registry = CollectorRegistry()
+    instrumentation.enable(registry=registry)
+
+    async def monitor():
+        task = asyncio.ensure_future(
+            instrumentation.monitor_event_loop(interval=0.01))
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    instrumentation.event_loop_lag.set(-1)
+    asyncio.run(monitor())
+    assert sample(registry, 'raritanpdu_exporter_event_loop_lag_seconds') >= 0
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_instrumentation_exporter(raritan_auth, monkeypatch):
+    registry = CollectorRegistry()
+    for metric in INSTRUMENTATION.metrics:
+        registry.register(metric)
+    monkeypatch.setattr(INSTRUMENTATION, 'enabled', True)
+
+    pdu = raritan_auth[0].name
+    requested = sample(
+        registry, 'raritanpdu_exporter_requested_readings_total', pdu=pdu)
+    exporter = RaritanExporter(config=raritan_auth, poll_interval=3600)
+    exporter.close()
+
+    n_sensors = exporter.pdus[0].n_sensors
+    assert sample(
+        registry, 'raritanpdu_exporter_requested_readings_total', pdu=pdu
+    ) == requested + n_sensors
+    assert sample(
+        registry, 'raritanpdu_exporter_returned_readings_total', pdu=pdu) > 0
+    assert sample(
+        registry, 'raritanpdu_exporter_request_duration_seconds_count',
+        pdu=pdu) >= 4  # discovery and reading
+    assert sample(
+        registry, 'raritanpdu_exporter_sent_bytes_total', pdu=pdu) > 0
+    assert sample(
+        registry, 'raritanpdu_exporter_received_bytes_total', pdu=pdu) > 0
+    for phase in ('http', 'decode', 'build'):
+        assert sample(
+            registry, 'raritanpdu_exporter_phase_duration_seconds_count',
+            phase=phase) > 0
@@ -1,5 +1,6 @@
 """Tests for prometheus_raritan_pdu_exporter/interfaces.py"""
 from unittest.mock import patch
+import json
 import time
 import fnmatch
 
@@ -8,9 +9,10 @@ import pytest
 import vcr
 
 from prometheus_raritan_pdu_exporter.interfaces import (
-    InterfaceError, MetricMismatchError, PDU, Connector, Pole, Sensor, Metric,
-    MetricFamily)
-from prometheus_raritan_pdu_exporter.jsonrpc import RaritanAuth
+    InterfaceError, MetricMismatchError, PDU, BatchSize, CircuitBreaker,
+    Schedule, Connector, Pole, Sensor, SensorFamily, Metric, MetricFamily)
+from prometheus_raritan_pdu_exporter.jsonrpc import (
+    RaritanAuth, Request, Responses, EmptyResponse)
 from prometheus_raritan_pdu_exporter import (
     EXPORTER_PREFIX, SENSORS_TYPES, SENSORS_COUNTERS, SENSORS_GAUGES,
     SENSORS_UNITS, SENSORS_DESCRIPTION)
@@ -134,6 +136,260 @@ def test_pdu_read_fail(raritan_auth):
         assert not metrics
 
 
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_pdu_read_batches(raritan_auth, monkeypatch):
+    pdu = PDU(auth=raritan_auth[0], batch=BatchSize(maximum=10, minimum=1))
+    asyncio.run(pdu.setup())
+    batches, built = [], []
+
+    async def mock_send(self, parse=Responses):
+        requests = json.loads(self.body)['params']['requests']
+        batches.append(len(requests))
+        built.append(len(self.requests))
+        self.duration = 0.01
+        return parse({'result': {'responses': [
+            {'json': {'id': r['json']['id'], 'result': {'_ret_': {
+                'value': 1.0, 'timestamp': 0}}}} for r in requests]}})
+
+    monkeypatch.setattr(Request, 'send', mock_send)
+    metrics = asyncio.run(pdu.read())
+
+    assert len(metrics) == pdu.n_sensors
+    assert sum(batches) == pdu.n_sensors
+    assert len(batches) == -(-pdu.n_sensors // 10)
+    assert max(batches) == 10
+    assert sum(built) == pdu.n_sensors
+
+    # serialized requests are reused by the next read
+    batches, built = [], []
+    assert len(asyncio.run(pdu.read())) == pdu.n_sensors
+    assert sum(batches) == pdu.n_sensors
+    assert sum(built) == 0
+    assert pdu.batch.per_reading is not None
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_pdu_read_schedule(raritan_auth, monkeypatch):
+    energy = f'{EXPORTER_PREFIX}_activeenergy_watthour_total'
+    pdu = PDU(auth=raritan_auth[0], schedule=Schedule(intervals={
+        'voltage': 3600, energy: 60}))
+    asyncio.run(pdu.setup())
+    slow = [i for i, interval in enumerate(pdu.intervals) if interval]
+    assert {pdu.intervals[i] for i in slow} == {60, 3600}
+    requested = []
+
+    async def mock_send(self, parse=Responses):
+        requests = json.loads(self.body)['params']['requests']
+        requested.extend(r['json']['id'] for r in requests)
+        return parse({'result': {'responses': [
+            {'json': {'id': r['json']['id'], 'result': {'_ret_': {
+                'value': len(requested), 'timestamp': 0}}}}
+            for r in requests]}})
+
+    monkeypatch.setattr(Request, 'send', mock_send)
+    first = asyncio.run(pdu.read_values())
+    assert sorted(requested) == list(range(pdu.n_sensors))
+
+    # sensors that are not due keep their latest reading
+    requested.clear()
+    second = asyncio.run(pdu.read_values())
+    assert set(requested) == set(range(pdu.n_sensors)) - set(slow)
+    assert all(second.values[i] == first.values[i] for i in slow)
+    assert None not in second.timestamps
+
+    # and are read again once they are due
+    requested.clear()
+    pdu.due[slow[0]] = 0
+    asyncio.run(pdu.read_values())
+    assert slow[0] in requested and slow[1] not in requested
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_pdu_read_breaker(raritan_auth, monkeypatch):
+    pdu = PDU(auth=raritan_auth[0], breaker=CircuitBreaker(threshold=2))
+    asyncio.run(pdu.setup())
+    sent = []
+
+    async def mock_send(self, parse=Responses):
+        sent.append(self)
+        return EmptyResponse(exception=ConnectionError('mocked error'))
+
+    monkeypatch.setattr(Request, 'send', mock_send)
+    assert asyncio.run(pdu.read_values()).failed
+
+    # reads without any due sensor do not reset the failures
+    intervals, due = pdu.intervals, pdu.due
+    pdu.intervals = [3600] * pdu.n_sensors
+    pdu.due = [float('inf')] * pdu.n_sensors
+    assert not asyncio.run(pdu.read_values()).failed
+    assert pdu.breaker.failures == 1 and len(sent) == 1
+    pdu.intervals, pdu.due = intervals, due
+
+    assert asyncio.run(pdu.read_values()).failed
+    assert pdu.breaker.is_open and len(sent) == 2
+
+    # reads are skipped while the PDU is down
+    readings = asyncio.run(pdu.read_values())
+    assert readings.failed and len(sent) == 2
+    assert set(readings.timestamps) == {None}
+
+    # until the retry succeeds
+    async def mock_read(self, parse=Responses):
+        sent.append(self)
+        return parse({'result': {'responses': [
+            {'json': {'id': 0, 'result': {'_ret_': {
+                'value': 1.0, 'timestamp': 0}}}}]}})
+
+    monkeypatch.setattr(Request, 'send', mock_read)
+    pdu.breaker.retry_at = 0
+    assert not asyncio.run(pdu.read_values()).failed
+    assert not pdu.breaker.is_open and len(sent) == 3
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker()
+    for _ in range(10):
+        breaker.failure(0)
+    assert not breaker.is_open and breaker.allow(0)
+
+    breaker = CircuitBreaker(threshold=2, delay=10, max_delay=25)
+    breaker.failure(0)
+    assert not breaker.is_open
+    breaker.failure(0)
+    assert breaker.is_open and breaker.backoff == 10
+    assert not breaker.allow(5)
+
+    # a single retry after the backoff delay, which doubles on failure
+    assert breaker.allow(10) and not breaker.allow(11)
+    breaker.failure(10)
+    assert breaker.backoff == 20 and breaker.retry_at == 30
+    breaker.failure(30)
+    assert breaker.backoff == 25
+
+    breaker.success()
+    assert not breaker.is_open and breaker.allow(31)
+
+
+def test_schedule(raritan_auth):
+    pdu = PDU(auth=raritan_auth[0])
+    connector = Connector(pdu=pdu, rid='unique_id/1', type='inlet')
+    voltage = Sensor(
+        rid='1', interface=SENSORS_GAUGES[0], metric=1, unit=1,
+        parent=connector)
+    named = Sensor(
+        rid='2', interface=SENSORS_GAUGES[0], name='activePower', unit=1,
+        parent=connector)
+
+    schedule = Schedule(intervals={'voltage': 10, named.name: 20})
+    assert schedule.interval(voltage) == 10
+    assert schedule.interval(named) == 20
+    assert Schedule(intervals={'activepower': 30}).interval(named) == 30
+    assert Schedule().interval(voltage) == 0
+    assert Schedule(intervals={
+        'voltage': 10, 'activepower': 30, 'temprature': 60}).unmatched(
+            [voltage, named]) == {'temprature'}
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_pdu_update(raritan_auth):
+    pdu = PDU(auth=raritan_auth[0])
+    asyncio.run(pdu.setup())
+    connectors, poles, sensors = pdu.connectors, pdu.poles, pdu.sensors
+
+    # an unchanged topology keeps all objects
+    discovered = (
+        [Connector(pdu=pdu, rid=c.rid, id=c.id, name=c.name, type=c.type)
+         for c in connectors],
+        [Pole(pdu=pdu, id=p.id, name=p.name) for p in poles],
+        list(sensors))
+    pdu.bodies[1] = [b'cached']
+    assert not pdu.update(*discovered)
+    assert pdu.bodies == {1: [b'cached']}
+    assert all(a is b for a, b in zip(pdu.connectors, connectors))
+    assert all(a is b for a, b in zip(pdu.poles, poles))
+
+    # a removed and an added sensor are swapped in, the rest is kept
+    added = Sensor(
+        rid='/new', interface=SENSORS_GAUGES[0], metric=8, unit=7,
+        parent=connectors[0])
+    assert pdu.update(connectors, poles, [*sensors[1:], added])
+    assert pdu.sensors[:-1] == sensors[1:]
+    assert pdu.sensors[-1] is added
+    assert pdu.bodies == {}
+    assert pdu.n_sensors == len(sensors)
+
+    # a sensor added to an unchanged connector refers to the kept connector
+    connector = connectors[0]
+    rediscovered = Connector(
+        pdu=pdu, rid=connector.rid, id=connector.id, name=connector.name,
+        type=connector.type)
+    added = Sensor(
+        rid='/newer', interface=SENSORS_GAUGES[0], metric=8, unit=7,
+        parent=rediscovered)
+    assert pdu.update(
+        [rediscovered, *connectors[1:]], poles, [*pdu.sensors, added])
+    assert pdu.connectors[0] is connector
+    assert pdu.sensors[-1].parent is connector
+    assert pdu.topology()['sensors'][-1]['parent'] == ['connectors', 0]
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_pdu_read_values(raritan_auth):
+    pdu = PDU(auth=raritan_auth[0])
+    asyncio.run(pdu.setup())
+    readings = asyncio.run(pdu.read_values())
+
+    # one value slot per sensor, precomputed families cover every sensor
+    assert readings.sensors is pdu.sensors
+    assert readings.families is pdu.families
+    assert len(readings.values) == len(readings.timestamps) == pdu.n_sensors
+    assert sorted(
+        i for family in pdu.families for i in family.indices
+    ) == list(range(pdu.n_sensors))
+    assert any(t is not None for t in readings.timestamps)
+
+
+def test_pdu_rediscover_fail(raritan_auth, monkeypatch):
+    async def mock_send(self):
+        return EmptyResponse(exception=ConnectionError('mocked error'))
+
+    pdu = PDU(auth=raritan_auth[0])
+    monkeypatch.setattr(Request, 'send', mock_send)
+    assert not asyncio.run(pdu.rediscover())
+    assert not pdu.is_discovered
+
+
+def test_batch_size():
+    batch = BatchSize()
+    assert batch.size(100) == 100  # all readings in a single request
+    assert batch.size(0) == 1
+
+    batch = BatchSize(maximum=20)
+    assert batch.size(100) == 20
+    assert batch.size(10) == 10
+
+    # tune to a latency of 1s per request
+    batch = BatchSize(latency=1, minimum=5)
+    batch.update(0, 1)
+    assert batch.per_reading is None
+    batch.update(100, 4)  # 0.04s per reading
+    assert batch.size(100) == 25
+    batch.update(100, 1)  # faster responses grow the batch size
+    assert 25 < batch.size(100) < 100
+    batch.update(10, 100)  # but never below the minimum
+    assert batch.size(100) == 5
+
+
 def test_connector(raritan_auth):
     pdu = PDU(auth=raritan_auth[0])
 
@@ -181,6 +437,24 @@ def test_sensor(raritan_auth):
         Sensor(rid='1', interface='foo', metric=1, unit=2, parent=connector)
 
 
+def test_sensor_family(raritan_auth):
+    pdu = PDU(auth=raritan_auth[0])
+    connector = Connector(pdu=pdu, rid='unique_id/1', type='inlet')
+    sensors = [
+        Sensor(rid=str(i), interface=SENSORS_GAUGES[0], metric=metric,
+               unit=1, parent=connector)
+        for i, metric in enumerate([1, 2, 1])]
+
+    families = SensorFamily.group(sensors)
+    assert [f.name for f in families] == [sensors[0].name, sensors[1].name]
+    assert families[0].indices == (0, 2)
+    assert families[0].interface == 'gauge'
+    assert families[0].description == SENSORS_DESCRIPTION[sensors[0].name]
+    assert families[0].labels[0] == (
+        pdu.name, connector.name, connector.type, str(connector.id))
+    assert families[1].indices == (1,)
+
+
 def test_sensor_camel_to_snake():
     test_values = {
         'FooBarBaz': 'foo_bar_baz', 'fooBarBaz': 'foo_bar_baz',
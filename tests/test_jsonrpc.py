@@ -1,9 +1,18 @@
 """Tests for prometheus_raritan_pdu_exporter/jsonrpc.py"""
+from types import SimpleNamespace
+import asyncio
+import json
+import multiprocessing
+import ssl
+import threading
+import time
+
 import pytest
 
+from benchmarks.mockpdu import MockServer
 from prometheus_raritan_pdu_exporter.jsonrpc import (
-    JSONRPCError, MultiResponseError, Response, Responses, RaritanAuth,
-    Request)
+    JSONRPCError, MultiResponseError, Response, Responses, ReadingResponses,
+    RaritanAuth, RaritanSession, Request, RequestLimit, loads)
 
 
 def test_response():
@@ -113,6 +122,37 @@ def test_responses_multi_responses_containing_errors():
     assert resp.responses[1].ret['bar'] == 'baz'
 
 
+def test_reading_responses():
+    """readings are stored at the position of their request id"""
+    json = {
+        'result': {'responses': [
+            {'json': {'id': 2, 'result': {'_ret_': {
+                'value': 1.5, 'timestamp': 10}}}},
+            {'json': {'id': 0, 'error': {'message': 'something went wrong'}}},
+            {'json': {'id': 1, 'result': {'_ret_': None}}}]}}
+    values, timestamps = [None] * 3, [None] * 3
+    resp = ReadingResponses(json=json, values=values, timestamps=timestamps)
+    assert resp.ids == [2]
+    assert values == [None, None, 1.5]
+    assert timestamps == [None, None, 10]
+
+    with pytest.raises(JSONRPCError):
+        ReadingResponses(json={'result': {'responses': [{'json': {}}]}},
+                         values=values, timestamps=timestamps)
+
+    # readings stored before an invalid response are cleared
+    json['result']['responses'].append({'json': {}})
+    values, timestamps = [None] * 3, [None] * 3
+    with pytest.raises(JSONRPCError):
+        ReadingResponses(json=json, values=values, timestamps=timestamps)
+    assert values == timestamps == [None] * 3
+
+
+def test_loads():
+    assert loads(b'{"id": 1, "result": [1.5, null]}') == {
+        'id': 1, 'result': [1.5, None]}
+
+
 def test_raritan_auth():
     auth = RaritanAuth(
         name='foo', url='https://127.0.0.1:9840', user='admin', password='xxx')
@@ -159,3 +199,99 @@ def test_request_add():
     assert len(request.requests) == 2
     assert request.requests[1]['json'] == expected_json
     assert request.requests[1]['rid'] == 'unique_id/2'
+
+
+def test_request_body(raritan_auth):
+    request = Request(raritan_auth[0])
+    request.add(rid='/model/pdu/0', method='getInlets', id=1)
+    body = request.body
+    assert json.loads(body) == request.json
+
+    cached = Request(raritan_auth[0], body=body, size=1)
+    assert cached.body is body
+    assert cached.size == request.size == 1
+
+
+def test_raritan_session():
+    auth = RaritanAuth(
+        name='foo', url='https://127.0.0.1:9840', user='admin', password='xxx')
+    session = RaritanSession(auth)
+    assert session.url == 'https://127.0.0.1:9840/bulk'
+    assert session.ssl.verify_mode == ssl.CERT_NONE
+    assert session.ssl is RaritanSession(auth).ssl
+
+    async def use_session():
+        client = session.client
+        assert session.client is client  # reused between requests
+        await session.close()
+        assert client.closed
+        assert session.client is not client  # reopened after close
+        await session.close()
+
+    asyncio.run(use_session())
+
+    auth = RaritanAuth(
+        name='foo', url='https://127.0.0.1:9840', user='admin', password='xxx',
+        verify_ssl=True)
+    assert RaritanSession(auth).ssl.verify_mode == ssl.CERT_NONE
+    assert RaritanSession.ssl_context(verify=True).verify_mode == (
+        ssl.CERT_REQUIRED)
+
+
+def test_request_limit(raritan_auth):
+    async def run(session, n):
+        active, peak = [], []
+
+        async def request():
+            async with session.slot():
+                active.append(1)
+                peak.append(len(active))
+                await asyncio.sleep(0.01)
+                active.pop()
+
+        await asyncio.gather(*[request() for _ in range(n)])
+        return max(peak)
+
+    session = RaritanSession(raritan_auth[0])
+    assert asyncio.run(run(session, 5)) == 5  # unlimited by default
+
+    shared = RequestLimit(3)
+    session = RaritanSession(
+        raritan_auth[0], limit=RequestLimit(2), shared=shared)
+    assert asyncio.run(run(session, 5)) == 2
+    session = RaritanSession(raritan_auth[0], shared=RequestLimit(3))
+    assert asyncio.run(run(session, 5)) == 3
+
+    with pytest.raises(ValueError):
+        RequestLimit(0)
+
+
+def test_request_duration(monkeypatch):
+    class Process(threading.Thread):
+        pass
+
+    monkeypatch.setattr(MockServer, 'context', SimpleNamespace(
+        Pipe=multiprocessing.Pipe, Process=Process))
+
+    async def run(url):
+        auth = RaritanAuth(name='pdu', url=url, user='admin', password='xxx')
+        session = RaritanSession(auth, limit=RequestLimit(1))
+        request = Request(auth, session=session)
+        request.add(rid='/model/pdu/0', method='getInlets', id='inlet')
+
+        async def hold():
+            async with session.slot():
+                await asyncio.sleep(0.2)
+
+        start = time.perf_counter()
+        held = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        await request.send()
+        await held
+        await session.close()
+        return request.duration, time.perf_counter() - start
+
+    # the duration does not include the time queued for a request slot
+    with MockServer() as url:
+        duration, total = asyncio.run(run(url))
+    assert total >= 0.2 and duration < 0.2
@@ -0,0 +1,253 @@
+"""Tests for prometheus_raritan_pdu_exporter/main.py"""
+from types import SimpleNamespace
+import argparse
+import gzip
+import threading
+import time
+import urllib.error
+import urllib.request
+import zlib
+
+import pytest
+from prometheus_client import CollectorRegistry
+from prometheus_client.core import GaugeMetricFamily
+
+from prometheus_raritan_pdu_exporter.exporter import SCRAPE_DEADLINE
+from prometheus_raritan_pdu_exporter.exposition import Exposition
+from prometheus_raritan_pdu_exporter.instrumentation import INSTRUMENTATION
+from prometheus_raritan_pdu_exporter.main import (
+    HealthcheckHandler, ThreadingWSGIServer, parse_args, read_config,
+    sensor_interval)
+from prometheus_raritan_pdu_exporter.profiling import PROFILER
+
+
+class BlockingCollector:
+    """Collector that blocks until released"""
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def collect(self):
+        self.started.set()
+        self.release.wait(10)
+        yield GaugeMetricFamily('blocking', 'blocking collection', value=1)
+
+
+class DeadlineCollector:
+    """Collector that records the scrape deadline"""
+    def __init__(self):
+        self.deadlines = []
+
+    def collect(self):
+        self.deadlines.append(SCRAPE_DEADLINE.get())
+        yield GaugeMetricFamily('deadline', 'scrape deadline', value=1)
+
+
+@pytest.fixture
+def server():
+    def serve(registry, workers=1, exporter=None):
+        handler = type(
+            'Handler', (HealthcheckHandler,),
+            {'registry': registry, 'exporter': exporter})
+        httpd = ThreadingWSGIServer(
+            ('127.0.0.1', 0), handler, workers=workers, timeout_offset=1)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        servers.append(httpd)
+        return f'http://127.0.0.1:{httpd.server_port}'
+
+    servers = []
+    yield serve
+    for httpd in servers:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_read_config():
+    config = read_config('tests/fixtures/config.json-example')
+    assert len(config) == 6
+    assert config[0].name == 'pdublue.rack0'
+
+
+def test_parse_args(monkeypatch):
+    monkeypatch.setattr('sys.argv', [
+        'raritanpdu', '-c', 'config.json', '--collect.batch-size', '10'])
+    assert parse_args().batch_size == 10
+
+    for option in (
+            '--collect.batch-size', '--collect.failure-threshold',
+            '--collect.max-requests', '--collect.max-requests-per-pdu'):
+        monkeypatch.setattr(
+            'sys.argv', ['raritanpdu', '-c', 'config.json', option, '0'])
+        with pytest.raises(SystemExit):
+            parse_args()
+
+
+def test_sensor_interval():
+    assert sensor_interval('temperature=60') == ('temperature', 60)
+    for value in (
+            'temperature', 'temperature=soon', '=60', 'temperature=0',
+            'temperature=-1'):
+        with pytest.raises(argparse.ArgumentTypeError):
+            sensor_interval(value)
+
+
+def test_threading_wsgi_server_workers():
+    with pytest.raises(ValueError):
+        ThreadingWSGIServer(('127.0.0.1', 0), HealthcheckHandler, workers=0)
+
+
+def test_healthcheck_during_collection(server):
+    collector = BlockingCollector()
+    registry = CollectorRegistry()
+    registry.register(collector)
+    url = server(registry)
+
+    results = []
+    scrape = threading.Thread(target=lambda: results.append(
+        urllib.request.urlopen(f'{url}/metrics', timeout=10).read()))
+    scrape.start()
+    assert collector.started.wait(10)
+
+    # the health check is answered while the collection is still running
+    response = urllib.request.urlopen(f'{url}/healthcheck', timeout=5)
+    assert response.status == 200
+    assert response.read() == b'Server is running'
+    assert scrape.is_alive()
+
+    collector.release.set()
+    scrape.join(10)
+    assert b'blocking 1.0' in results[0]
+
+
+def test_scrape_deadline(server):
+    collector = DeadlineCollector()
+    registry = CollectorRegistry()
+    registry.register(collector)
+    url = server(registry)
+
+    header = 'X-Prometheus-Scrape-Timeout-Seconds'
+    request = urllib.request.Request(f'{url}/metrics', headers={header: '10'})
+    start = time.monotonic()
+    urllib.request.urlopen(request, timeout=5).read()
+    assert start + 8 < collector.deadlines[0] <= time.monotonic() + 9
+
+    # no (valid) scrape timeout, no deadline
+    urllib.request.urlopen(f'{url}/metrics', timeout=5).read()
+    request = urllib.request.Request(f'{url}/metrics', headers={header: 'x'})
+    urllib.request.urlopen(request, timeout=5).read()
+    assert collector.deadlines[1:] == [None, None]
+
+
+def test_render_phase(server, monkeypatch):
+    phases = []
+    monkeypatch.setattr(INSTRUMENTATION, 'enabled', True)
+    monkeypatch.setattr(
+        INSTRUMENTATION, 'phase',
+        lambda phase, duration: phases.append(phase))
+    registry = CollectorRegistry()
+    registry.register(DeadlineCollector())
+    url = server(registry)
+
+    # scrapes collected from the registry time their rendering as well
+    output = urllib.request.urlopen(f'{url}/metrics', timeout=5).read()
+    assert b'deadline 1.0' in output
+    assert phases == ['render']
+
+
+def test_prerendered_exposition(server):
+    registry = CollectorRegistry()
+    registry.register(DeadlineCollector())
+    exposition = Exposition([GaugeMetricFamily('cached', 'cached', value=2)])
+    url = server(registry, exporter=SimpleNamespace(exposition=exposition))
+
+    def scrape(path='/metrics', **headers):
+        request = urllib.request.Request(f'{url}{path}', headers=headers)
+        return urllib.request.urlopen(request, timeout=5).read()
+
+    plain = scrape()
+    assert b'cached 2.0' in plain and b'deadline 1.0' in plain
+    compressed = scrape(**{'Accept-Encoding': 'gzip'})
+    assert gzip.decompress(compressed) == plain
+
+    # as a single gzip member, which is all some clients (e.g., curl) read
+    decompressor = zlib.decompressobj(wbits=31)
+    assert decompressor.decompress(compressed) == plain
+    assert decompressor.eof and decompressor.unused_data == b''
+
+    # the exposition is rendered once per format and encoding
+    rendered = dict(exposition._rendered)
+    assert len(rendered) == 2
+    scrape()
+    assert all(exposition._rendered[k] is v for k, v in rendered.items())
+
+    # a single EOF marker at the end of OpenMetrics expositions
+    openmetrics = scrape(Accept='application/openmetrics-text')
+    assert openmetrics.count(b'# EOF') == 1
+    assert openmetrics.endswith(b'# EOF\n')
+    assert b'cached 2.0' in openmetrics
+
+    # filtered requests are collected from the registry
+    assert b'cached' not in scrape('/metrics?name[]=deadline')
+
+
+def test_probe(server):
+    def probe(target):
+        if target != 'pdu':
+            raise KeyError(target)
+        return [GaugeMetricFamily('probed', 'probed', value=1)]
+
+    registry = CollectorRegistry()
+    registry.register(DeadlineCollector())
+    url = server(registry, exporter=SimpleNamespace(
+        probe=probe, exposition=None))
+
+    output = urllib.request.urlopen(
+        f'{url}/probe?target=pdu', timeout=5).read()
+    assert b'probed 1.0' in output
+    assert b'deadline' not in output
+
+    request = urllib.request.Request(
+        f'{url}/probe?target=pdu', headers={'Accept-Encoding': 'gzip'})
+    assert gzip.decompress(
+        urllib.request.urlopen(request, timeout=5).read()) == output
+
+    for path in ('/probe?target=unknown', '/probe'):
+        with pytest.raises(urllib.error.HTTPError) as exc:
+            urllib.request.urlopen(f'{url}{path}', timeout=5)
+        assert exc.value.code == 400
+
+    # probing requires an exporter
+    url = server(registry)
+    with pytest.raises(urllib.error.HTTPError) as exc:
+        urllib.request.urlopen(f'{url}/probe?target=pdu', timeout=5)
+    assert exc.value.code == 404
+
+
+def test_profile(server, tmp_path, monkeypatch):
+    url = server(CollectorRegistry())
+
+    def post(path):
+        request = urllib.request.Request(f'{url}{path}', data=b'')
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as exc:
+            return exc.code, None
+
+    assert post('/profile')[0] == 404  # profiling is not enabled
+    monkeypatch.setattr(PROFILER, 'directory', str(tmp_path))
+    monkeypatch.setattr(PROFILER, 'remaining', 0)
+    assert post('/metrics')[0] == 404
+    assert post('/profile?collections=foo')[0] == 400
+
+    status, body = post('/profile?collections=3')
+    assert status == 202 and b'next 3 collections' in body
+    assert PROFILER.remaining == 3
+    assert post('/profile')[0] == 202
+    assert PROFILER.remaining == PROFILER.collections
+
+    # the number of collections per request is bounded
+    limit = PROFILER.max_collections
+    assert post(f'/profile?collections={limit}')[0] == 202
+    assert post(f'/profile?collections={limit + 1}')[0] == 400
+    assert PROFILER.remaining == limit
@@ -0,0 +1,63 @@
+"""Tests for benchmarks/mockpdu.py"""
+from types import SimpleNamespace
+import multiprocessing
+import threading
+
+from benchmarks.mockpdu import MockPDU, MockServer, Topology
+from prometheus_raritan_pdu_exporter import EXPORTER_PREFIX
+from prometheus_raritan_pdu_exporter.exporter import RaritanExporter
+from prometheus_raritan_pdu_exporter.jsonrpc import (
+    ReadingResponses, RaritanAuth, Request, Responses)
+
+
+def bulk(pdu, *requests):
+    request = Request(auth=None)
+    for rid, method, id in requests:
+        request.add(rid=rid, method=method, id=id)
+    return pdu.bulk(request.json)
+
+
+def test_mock_pdu():
+    pdu = MockPDU(topology=Topology(outlets=2, devices=1, slots=2), seed=0)
+    assert Topology(outlets=2, devices=1, slots=2).n_sensors == 42
+    rids = Responses(bulk(
+        pdu, ('/model/pdu/0', 'getOutlets', 'outlet'),
+        ('/model/pdu/0', 'getFoo', 'foo')))
+    assert [r.id for r in rids.responses] == ['outlet', 'outlet']
+
+    sensors = [rid for rid in pdu.ranges]
+    values, timestamps = [None] * 2, [None] * 2
+    readings = ReadingResponses(bulk(
+        pdu, (sensors[0], 'getReading', 0), (sensors[-1], 'getReading', 1)),
+        values=values, timestamps=timestamps)
+    assert readings.ids == [0, 1]
+    assert pdu.ranges[sensors[0]][0] <= values[0] <= pdu.ranges[sensors[0]][1]
+    assert pdu.requests == 2
+
+    assert 'error' in pdu.bulk({'method': 'getFoo', 'id': 0})
+    assert 'error' in MockPDU(error_rate=1).bulk(Request(auth=None).json)
+
+
+def test_mock_server(monkeypatch):
+    # the mock PDUs are served from a thread
+    class Process(threading.Thread):
+        pass
+
+    monkeypatch.setattr(MockServer, 'context', SimpleNamespace(
+        Pipe=multiprocessing.Pipe, Process=Process))
+    topology = Topology(outlets=4)
+    with MockServer(topology=topology) as url:
+        config = [
+            RaritanAuth(name=f'pdu{i}', url=url, user='admin', password='xxx')
+            for i in range(2)]
+        exporter = RaritanExporter(config=config)
+        assert [pdu.n_sensors for pdu in exporter.pdus] == [
+            topology.n_sensors] * 2
+
+        results = {family.name: family for family in exporter.collect()}
+        exporter.close()
+
+    up = results[f'{EXPORTER_PREFIX}_up']
+    assert [sample.value for sample in up.samples] == [1, 1]
+    assert len(results[f'{EXPORTER_PREFIX}_voltage_volt'].samples) == 2 * (
+        1 + 3 + 4)  # inlet, poles and outlets
@@ -0,0 +1,75 @@
+"""Tests for prometheus_raritan_pdu_exporter/profiling.py"""
+import os
+import pstats
+
+import pytest
+import vcr
+
+from prometheus_raritan_pdu_exporter.eventloop import EventLoopThread
+from prometheus_raritan_pdu_exporter.exporter import RaritanExporter
+from prometheus_raritan_pdu_exporter.profiling import PROFILER, Profiler
+
+
+def test_profiler(tmp_path):
+    profiler = Profiler()
+    assert not profiler.available
+    with pytest.raises(RuntimeError):
+        profiler.request()
+    with pytest.raises(ValueError):
+        profiler.enable(str(tmp_path), collections=0)
+    with pytest.raises(ValueError):
+        profiler.enable(
+            str(tmp_path), collections=profiler.max_collections + 1)
+
+    directory = str(tmp_path / 'profiles')
+    profiler.enable(directory, collections=2)
+    loop = EventLoopThread()
+    with profiler.collection(loop):
+        pass
+    assert os.listdir(directory) == []  # not requested
+
+    assert profiler.request() == 2
+    with profiler.collection(loop, 'first'):
+        # only a single collection is profiled at a time
+        with profiler.collection(loop, 'nested'):
+            sum(range(1000))
+    assert profiler.remaining == 1
+    assert sorted(name.rsplit('.')[-1] for name in os.listdir(directory)) == [
+        'prof', 'txt']
+    assert all('first' in name for name in os.listdir(directory))
+
+    with profiler.collection(loop, 'second'):
+        pass
+    with profiler.collection(loop, 'third'):
+        pass
+    assert profiler.remaining == 0
+    assert not any('third' in name for name in os.listdir(directory))
+
+    # failures to write the profile do not fail the collection
+    profiler.request(1)
+    profiler.directory = str(tmp_path / 'missing')
+    with profiler.collection(loop, 'failed'):
+        pass
+    assert profiler.remaining == 0 and not profiler._active
+    loop.stop()
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_profiler_exporter(raritan_auth, tmp_path, monkeypatch):
+    monkeypatch.setattr(PROFILER, 'directory', str(tmp_path))
+    exporter = RaritanExporter(config=raritan_auth)
+    PROFILER.request(1)
+    _ = list(exporter.collect())
+    exporter.close()
+    assert PROFILER.remaining == 0
+
+    profiles = [
+        name for name in os.listdir(tmp_path) if name.endswith('.prof')]
+    assert len(profiles) == 1
+    functions = {
+        function for _, _, function in pstats.Stats(
+            str(tmp_path / profiles[0])).stats}
+    # both the event loop (reading) and the collecting thread are profiled
+    assert {'read_values', '_families'} <= functions
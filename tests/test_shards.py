@@ -0,0 +1,166 @@
+"""Tests for prometheus_raritan_pdu_exporter/shards.py"""
+from types import SimpleNamespace
+import json
+import multiprocessing
+import threading
+import time
+
+import pytest
+import vcr
+from prometheus_client.core import GaugeMetricFamily
+
+from benchmarks.mockpdu import MockServer, Topology
+from prometheus_raritan_pdu_exporter import EXPORTER_PREFIX
+from prometheus_raritan_pdu_exporter.exporter import (
+    PRERENDERED, RaritanExporter)
+from prometheus_raritan_pdu_exporter.jsonrpc import RaritanAuth
+from prometheus_raritan_pdu_exporter.shards import (
+    ShardedExporter, merge, select, shard_of, split)
+
+
+def test_split(raritan_auth):
+    shards = split(raritan_auth, 3)
+    assert len(shards) == 3
+    assert sorted(a.name for s in shards for a in s) == sorted(
+        a.name for a in raritan_auth)
+
+    # adding a PDU does not move any of the other PDUs
+    added = RaritanAuth(
+        name='added', url='https://127.0.0.1', user='admin', password='xxx')
+    grown = split([*raritan_auth, added], 3)
+    assert all(auth in grown[shard_of(auth, 3)] for auth in raritan_auth)
+    assert added in grown[shard_of(added, 3)]
+
+
+def test_select(raritan_auth):
+    replicas = [select(raritan_auth, i, 2) for i in range(2)]
+    assert sorted(a.name for r in replicas for a in r) == sorted(
+        a.name for a in raritan_auth)
+    assert replicas == split(raritan_auth, 2)
+
+    # processes split the PDUs of a replica independently of the replicas
+    assert split(raritan_auth, 2, salt='foo') != replicas
+
+    with pytest.raises(ValueError):
+        select(raritan_auth, 2, 2)
+
+
+def test_merge():
+    a = GaugeMetricFamily('foo', 'foo', labels=['pdu'])
+    a.add_metric(['a'], 1)
+    b = GaugeMetricFamily('foo', 'foo', labels=['pdu'])
+    b.add_metric(['b'], 2)
+    c = GaugeMetricFamily('bar', 'bar', value=3)
+
+    merged = merge([[a], [b, c]])
+    assert [family.name for family in merged] == ['foo', 'bar']
+    assert [s.labels['pdu'] for s in merged[0].samples] == ['a', 'b']
+    assert len(a.samples) == 1  # the families of the shards are unchanged
+
+
+def test_sharded_exporter_options(raritan_auth):
+    with pytest.raises(ValueError):
+        ShardedExporter(raritan_auth, processes=1, poll_interval=10)
+    with pytest.raises(ValueError):
+        ShardedExporter(raritan_auth, processes=2, poll_interval=None)
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_sharded_exporter(raritan_auth, monkeypatch):
+    # shards run in threads, so that the requests are played back
+    class Process(threading.Thread):
+        pass
+
+    monkeypatch.setattr(ShardedExporter, 'context', SimpleNamespace(
+        Pipe=multiprocessing.Pipe, Process=Process))
+    exporter = ShardedExporter(raritan_auth, processes=3, poll_interval=3600)
+
+    results = {family.name: family for family in exporter.collect()}
+    missed = results[f'{EXPORTER_PREFIX}_deadline_exceeded']
+    assert sorted(s.labels['pdu'] for s in missed.samples) == sorted(
+        auth.name for auth in raritan_auth)
+    pdus = {
+        sample.labels['pdu'] for family in results.values()
+        for sample in family.samples}
+    assert pdus == {auth.name for auth in raritan_auth}
+
+    # readings served from the pre-rendered exposition are not collected
+    token = PRERENDERED.set(True)
+    assert list(exporter.collect()) == []
+    PRERENDERED.reset(token)
+
+    exporter.close()
+    assert exporter.exposition is None
+    assert list(exporter.collect()) == []
+
+
+class Thread(threading.Thread):
+    pass
+
+
+def up(exporter):
+    families = {family.name: family for family in exporter.collect()}
+    return {
+        sample.labels['pdu']: sample.value
+        for sample in families[f'{EXPORTER_PREFIX}_up'].samples}
+
+
+@pytest.fixture
+def mock_pdus(monkeypatch):
+    """Configuration of mock PDUs, served from a thread"""
+    monkeypatch.setattr(MockServer, 'context', SimpleNamespace(
+        Pipe=multiprocessing.Pipe, Process=Thread))
+    with MockServer(topology=Topology(outlets=2)) as url:
+        yield [
+            RaritanAuth(name=f'pdu{i}', url=url, user='admin', password='xxx')
+            for i in range(4)]
+
+
+def test_sharded_exporter_spawned(mock_pdus):
+    exporter = ShardedExporter(mock_pdus, processes=2, poll_interval=3600)
+    assert up(exporter) == {auth.name: 1 for auth in mock_pdus}
+
+    # PDUs of a worker process that stopped are reported as down
+    stopped = next(
+        shard for shard in split(mock_pdus, 2, salt=exporter.salt) if shard)
+    process = exporter._workers[0][0]
+    process.terminate()
+    process.join()
+    start = time.monotonic()
+    while 0 not in up(exporter).values() and time.monotonic() - start < 10:
+        time.sleep(0.01)
+    assert up(exporter) == {
+        auth.name: int(auth not in stopped) for auth in mock_pdus}
+    exporter.close()
+
+
+def test_sharded_exporter_cache(mock_pdus, monkeypatch, tmp_path):
+    # every worker process keeps the topologies of its shard in its own file
+    monkeypatch.setattr(ShardedExporter, 'context', SimpleNamespace(
+        Pipe=multiprocessing.Pipe, Process=Thread))
+    cache = str(tmp_path / 'topology.json')
+    exporter = ShardedExporter(
+        mock_pdus, processes=2, poll_interval=3600, cache=cache)
+    exporter.close()
+
+    shards = split(mock_pdus, 2, salt=exporter.salt)
+    for shard, pdus in enumerate(shards):
+        if pdus:
+            with open(f'{cache}.{shard}') as json_file:
+                assert set(json.load(json_file)) == {a.name for a in pdus}
+    assert sum(1 for pdus in shards if pdus) == len(list(tmp_path.iterdir()))
+
+
+def test_sharded_exporter_poll_failed(mock_pdus, monkeypatch):
+    def poll(self):
+        raise RuntimeError('mocked error')
+
+    # failed polls are logged, the PDUs of the first one are down
+    monkeypatch.setattr(ShardedExporter, 'context', SimpleNamespace(
+        Pipe=multiprocessing.Pipe, Process=Thread))
+    monkeypatch.setattr(RaritanExporter, 'poll', poll)
+    exporter = ShardedExporter(mock_pdus, processes=2, poll_interval=3600)
+    assert up(exporter) == {auth.name: 0 for auth in mock_pdus}
+    exporter.close()
@@ -0,0 +1,101 @@
+"""Tests for prometheus_raritan_pdu_exporter/tracing.py"""
+import json
+import threading
+
+import pytest
+import vcr
+
+from prometheus_raritan_pdu_exporter.exporter import RaritanExporter
+from prometheus_raritan_pdu_exporter.tracing import TRACER, Tracer
+
+
+def spans(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file]
+
+
+@pytest.fixture
+def traces(tmp_path, monkeypatch):
+    """Path of the trace file, with the handlers of the traces logger
+    restored afterwards"""
+    monkeypatch.setattr(TRACER.logger, 'handlers', [])
+    yield str(tmp_path / 'traces.jsonl')
+    for handler in TRACER.logger.handlers:
+        handler.close()
+
+
+def test_tracer(traces):
+    tracer = Tracer()
+    with tracer.trace('collect', collect_id='abc') as span:
+        assert span is None  # disabled
+    with pytest.raises(ValueError):
+        tracer.enable(traces, sample_rate=2)
+
+    tracer.enable(traces)
+    with tracer.trace('collect', collect_id='abc') as root:
+        with tracer.span('build') as span:
+            tracer.tag(metrics=3)
+        assert tracer.missing(
+            'reading', requested=range(3), returned=[1], source='pdu',
+            collect_id='abc', name=lambda i: f'/sensor/{i}') == [0, 2]
+
+        # spans in other threads find the trace by its collection id
+        def read():
+            with tracer.span('read', collect_id='abc'):
+                pass
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+    with pytest.raises(KeyError):
+        with tracer.trace('failed'):
+            raise KeyError('key')
+
+    tracer.sample_rate = 0
+    with tracer.trace('collect', collect_id='def') as span:
+        assert span is None
+        assert tracer.missing('reading', requested=[0], returned=[]) == []
+
+    build, read, collect, failed = spans(traces)
+    assert [s['name'] for s in (build, read, collect, failed)] == [
+        'build', 'read', 'collect', 'failed']
+    assert build['traceId'] == read['traceId'] == collect['traceId']
+    assert build['parentId'] == read['parentId'] == collect['id'] == root.id
+    assert 'parentId' not in collect
+    assert build['tags'] == {'metrics': '3'}
+    assert collect['tags'] == {
+        'collect_id': 'abc', 'missing.reading': '/sensor/0,/sensor/2',
+        'missing.reading.count': '2'}
+    assert failed['tags'] == {'error': "KeyError: 'key'"}
+    assert collect['duration'] >= 1
+    assert collect['localEndpoint'] == {'serviceName': tracer.service}
+
+
+@vcr.use_cassette(
+    'tests/fixtures/vcr_cassettes/data.yaml',
+    filter_headers=['authorization'])
+def test_tracer_exporter(raritan_auth, traces, monkeypatch):
+    monkeypatch.setattr(TRACER, 'enabled', False)
+    TRACER.enable(traces)
+    exporter = RaritanExporter(config=raritan_auth)
+    list(exporter.collect())
+    exporter.close()
+
+    result = spans(traces)
+    discoveries = [s for s in result if s['name'] == 'discover']
+    assert len(discoveries) == len(exporter.pdus)
+    collect, = [s for s in result if s['name'] == 'collect']
+    trace = [s for s in result if s['traceId'] == collect['traceId']]
+    names = {s['name'] for s in trace}
+    assert names == {'collect', 'read', 'request', 'build'}
+    ids = {s['id'] for s in trace}
+    assert all(s['parentId'] in ids for s in trace if s is not collect)
+    requests = [s for s in trace if s['name'] == 'request']
+    assert all(int(s['tags']['received']) > 0 for s in requests)
+    assert all(int(s['tags']['requests']) > 0 for s in requests)
+
+    # sensors without a reading are reported by their resource
+    missing = [
+        rid for s in trace for rid in s['tags'].get(
+            'missing.reading', '').split(',') if rid]
+    assert missing and all(rid.startswith('/') for rid in missing)